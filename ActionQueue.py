@@ -0,0 +1,331 @@
+# region License
+"""
+ * SimplRPA - A simple RPA library for Python and C#
+ *
+ * Copyright (c) 2009-2021 Michael Halpin
+ * Modifications (c) as per Git change history
+ *
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at
+ * https://mozilla.org/MPL/2.0/.
+ *
+ * The above copyright notice and this permission notice shall be included in all copies or substantial
+ * portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT
+ * LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NON-INFRINGEMENT.
+ * IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+# endregion
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+import _Platform_Convergence
+from Keyboard import *
+from Mouse import *
+
+ActionQueueStats = collections.namedtuple("ActionQueueStats", "queue_depth completed failed mean_wait mean_latency "
+                                                              "max_latency")
+
+
+class ActionQueueConfig:
+    """
+    Instances contain the configuration settings for how an ActionQueue runs.
+    :prop latency_window: How many of the latest actions the latency statistics are measured over.
+    :prop cancel_on_fail_safe: If true a fail-safe exception cancels every action still in the queue.
+    """
+    latency_window = 100
+    cancel_on_fail_safe = True
+
+
+class ActionFuture(concurrent.futures.Future):
+    """
+    The future of an action submitted to an ActionQueue. On top of the result it records when the action was queued,
+    started and finished, in time.perf_counter() seconds. It can be awaited with asyncio.wrap_future().
+    """
+
+    def __init__(self, name):
+        """
+        :param name: What the action is called, such as "Mouse.click".
+        """
+        super().__init__()
+        self.name = name
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+
+    def wait_time(self):
+        """
+        Returns how long the action waited in the queue before it started.
+        :return: float seconds, or None if it hasn't started.
+        """
+        return None if self.started_at is None else self.started_at - self.queued_at
+
+    def run_time(self):
+        """
+        Returns how long the action took to run, including its pauses and tweens.
+        :return: float seconds, or None if it hasn't finished.
+        """
+        return None if self.finished_at is None or self.started_at is None else self.finished_at - self.started_at
+
+    def latency(self):
+        """
+        Returns how long it took from submitting the action to it finishing.
+        :return: float seconds, or None if it hasn't finished.
+        """
+        return None if self.finished_at is None else self.finished_at - self.queued_at
+
+    def __repr__(self):
+        return "ActionFuture(%s)" % self.name
+
+
+class _ActionProxy:
+    """
+    Stands in for the Mouse or Keyboard class: calling one of its methods submits the call to the queue instead of
+    running it.
+    """
+
+    def __init__(self, action_queue, cls):
+        self._action_queue = action_queue
+        self._cls = cls
+
+    def __getattr__(self, name):
+        function = getattr(self._cls, name)
+
+        def submit(*args, **kwargs):
+            return self._action_queue.submit_named("%s.%s" % (self._cls.__name__, name), function, *args, **kwargs)
+
+        return submit
+
+
+class ActionQueue:
+    """
+    Runs Mouse and Keyboard actions in order on one dedicated input thread and hands back a future for each, so the
+    caller isn't blocked for the whole action with its pauses and tweens, and can analyze the screen for the next step
+    while the current one runs. On X11 the input thread opens an X connection of its own, so its input never shares
+    the connection other threads use for size(), screen change checks and pixel reads.
+    Usage: queue.mouse.click((100, 100)) or queue.submit(Keyboard.type_keys, "hello").
+    """
+
+    def __init__(self, config=None):
+        """
+        :param config: The configuration object that contains setting for how the queue runs.
+        """
+
+        if config is None:
+            config = ActionQueueConfig()
+
+        self.config = config
+        self.mouse = _ActionProxy(self, Mouse)
+        self.keyboard = _ActionProxy(self, Keyboard)
+        self.completed = 0
+        self.failed = 0
+        self._actions = queue.Queue()
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=max(1, config.latency_window))
+        self._outstanding = set()  # The futures that haven't finished or been cancelled yet.
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the input thread.
+        :return: self
+        """
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ActionQueue input", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, cancel_pending=False, timeout=None):
+        """
+        Stops the input thread once the actions already queued have run. Submitting another action starts it again.
+        :param cancel_pending: If true the actions that haven't started are cancelled instead of run.
+        :param timeout: How long to wait for the thread to finish.
+        :return: void
+        """
+
+        if cancel_pending:
+            self.cancel_pending()
+
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                self._thread = None
+                return
+
+            # The thread clears _thread itself when it reads this, so a timed out stop() never leaves two of them.
+            self._actions.put(None)
+
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues a call, such as submit(Mouse.click, (100, 100)), starting the input thread if it isn't running.
+        :param function: The Mouse or Keyboard method, or any other function that sends input.
+        :param args: The arguments to call it with.
+        :param kwargs: The keyword arguments to call it with.
+        :return: ActionFuture
+        """
+        return self.submit_named(getattr(function, "__qualname__", repr(function)), function, *args, **kwargs)
+
+    def submit_named(self, name, function, *args, **kwargs):
+        """
+        Queues a call under a name, which is how its ActionFuture reports it.
+        :param name: What the action is called.
+        :param function: The function that sends input.
+        :param args: The arguments to call it with.
+        :param kwargs: The keyword arguments to call it with.
+        :return: ActionFuture
+        """
+
+        future = ActionFuture(name)
+        future.add_done_callback(self._forget)
+        with self._lock:
+            self._outstanding.add(future)
+            self._actions.put((future, function, args, kwargs))
+        self.start()
+        return future
+
+    def wait(self, timeout=None):
+        """
+        Blocks until every action submitted so far has finished.
+        :param timeout: How long to wait in seconds, or None to wait forever.
+        :return: Boolean, false on a timeout.
+        """
+
+        with self._lock:
+            outstanding = list(self._outstanding)
+        return len(concurrent.futures.wait(outstanding, timeout).not_done) == 0
+
+    def cancel_pending(self):
+        """
+        Cancels every action that hasn't started yet.
+        :return: int how many were cancelled.
+        """
+
+        cancelled = 0
+        stops = 0
+        while True:
+            try:
+                item = self._actions.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stops += 1
+                continue
+            future = item[0]
+            if future.cancel():
+                cancelled += 1
+                future.set_running_or_notify_cancel()  # Wakes wait(), concurrent.futures.wait() and as_completed().
+
+        for _ in range(stops):
+            self._actions.put(None)  # Keep the stop() that is already waiting for the thread.
+        return cancelled
+
+    def queue_depth(self):
+        """
+        Returns how many actions are waiting to start.
+        :return: int
+        """
+        return self._actions.qsize()
+
+    def latencies(self):
+        """
+        Returns the latest finished actions, oldest first, up to the config's latency_window of them.
+        :return: ActionFuture[]
+        """
+        with self._lock:
+            return list(self._recent)
+
+    def stats(self):
+        """
+        Returns the queue depth, the number of completed and failed actions, and the mean wait in the queue and the mean
+        and max latency, from submitting to finishing, in seconds over the latest actions.
+        :return: ActionQueueStats
+        """
+
+        recent = self.latencies()
+        waits = [future.wait_time() for future in recent]
+        latencies = [future.latency() for future in recent]
+        return ActionQueueStats(self.queue_depth(), self.completed, self.failed,
+                                sum(waits) / len(waits) if waits else 0.0,
+                                sum(latencies) / len(latencies) if latencies else 0.0,
+                                max(latencies) if latencies else 0.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop(cancel_pending=exc_type is not None)
+
+    def _forget(self, future):
+        """
+        Drops a finished or cancelled future from the ones wait() waits for.
+        :param future: The ActionFuture.
+        :return: void
+        """
+        with self._lock:
+            self._outstanding.discard(future)
+
+    def _run(self):
+        """
+        The input loop.
+        :return: void
+        """
+
+        # noinspection PyProtectedMember
+        with _Platform_Convergence.platform_module._thread_connection():
+            self._loop()
+
+    def _loop(self):
+        """
+        Runs the actions as they are queued, until a stop() with nothing queued after it.
+        :return: void
+        """
+
+        while True:
+            item = self._actions.get()
+            if item is None:
+                with self._lock:
+                    if self._actions.empty():
+                        self._thread = None
+                        return
+                continue  # More actions were submitted after the stop(); keep running them.
+
+            future, function, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            future.started_at = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+                error = None
+            except Exception as ex:
+                result = None
+                error = ex
+            future.finished_at = time.perf_counter()
+
+            # Counted before the future is resolved, so stats() already includes an action whose result was awaited.
+            with self._lock:
+                self._recent.append(future)
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+            if error is None:
+                future.set_result(result)
+                continue
+
+            future.set_exception(error)
+            if isinstance(error, _Platform_Convergence.FailSafeException) and self.config.cancel_on_fail_safe:
+                # The user is trying to stop the script: don't send any more of its input.
+                self.cancel_pending()
@@ -1,6 +1,17 @@
+import asyncio
+import collections
+import sys
+import threading
+from abc import ABC, abstractmethod
 import _Platform_Convergence
 from Screen import *
 
+WaitStats = collections.namedtuple("WaitStats", "name result polls elapsed")
+ConditionResult = collections.namedtuple("ConditionResult", "fired elapsed")
+
+_damage_supported = None  # Whether X DAMAGE notifications work here. None until wait_for_change first tries them.
+_damage_watchers = threading.local()  # Each thread gets its own DamageWatcher so they don't steal each other's events.
+
 
 # noinspection GrazieInspection
 class DelayConfig:
@@ -9,13 +20,339 @@ class DelayConfig:
     :prop timeout: How long to wait for a timeout to occur.
     :prop threshold: The percentile matching threshold to determine how close a match needs to be.
     :prop log_screenshot: If true the method takes a screenshot after the action.
+    :prop min_interval: The shortest time between two polls of the screen.
+    :prop max_interval: The longest time between two polls of the screen.
+    :prop backoff: How much the time between polls grows each time the screen hasn't changed.
+    :prop use_damage: If true wait_for_change sleeps until X11 reports drawing in the area instead of polling it.
     """
     timeout = 30
     threshold = 1
     log_screenshot = False
+    min_interval = 0.01
+    max_interval = 0.25
+    backoff = 1.5
+    use_damage = True
+
+
+class Poller:
+    """
+    Paces the polling loop of a wait operation. The time between polls backs off exponentially from min_interval to
+    max_interval while the watched state stays the same, and the next poll happens right away once it changes.
+    """
+
+    _NOTHING = object()
+
+    def __init__(self, config):
+        """
+        Starts the clock for a wait operation.
+        :param config: The configuration object with the timeout and poll interval settings.
+        """
+        self.min_interval = config.min_interval
+        self.max_interval = config.max_interval
+        self.backoff = config.backoff
+        self.interval = 0.0
+        self.polls = 0
+        self.start = time.monotonic()
+        self.end = self.start + config.timeout
+        self._state = Poller._NOTHING
+
+    def next(self):
+        """
+        Sleeps until the next poll is due. The last poll happens at the timeout.
+        :return: False once the timeout has passed.
+        """
+
+        remaining = self.end - time.monotonic()
+        if remaining <= 0:
+            return False
+
+        if self.polls > 0 and self.interval > 0:
+            time.sleep(min(self.interval, remaining))
+
+        self.polls += 1
+        return True
+
+    async def next_async(self):
+        """
+        Waits without blocking the event loop until the next poll is due. The last poll happens at the timeout.
+        :return: False once the timeout has passed.
+        """
+
+        remaining = self.end - time.monotonic()
+        if remaining <= 0:
+            return False
+
+        if self.polls > 0 and self.interval > 0:
+            await asyncio.sleep(min(self.interval, remaining))
+        else:
+            await asyncio.sleep(0)  # Still let the other tasks run between polls.
+
+        self.polls += 1
+        return True
+
+    def observe(self, state):
+        """
+        Records what the last poll saw, to decide how soon to poll again.
+        :param state: The watched value, such as a color or a captured image.
+        :return: void
+        """
+
+        if self._state is not Poller._NOTHING and not Poller._same(state, self._state):
+            self.interval = 0.0  # Something is happening on screen, so look again straight away.
+        elif self.interval == 0:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        self._state = state
+
+    def remaining(self):
+        """
+        Returns how long is left until the timeout.
+        :return: float
+        """
+        return max(0.0, self.end - time.monotonic())
+
+    def elapsed(self):
+        """
+        Returns how long the wait has taken so far.
+        :return: float
+        """
+        return time.monotonic() - self.start
+
+    @staticmethod
+    def _same(a, b):
+        if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+            return np.array_equal(a, b)
+        return a == b
+
+
+class Condition(ABC):
+    """
+    Something to wait for in an area of the screen. Delays.wait_for_any and Delays.wait_for_all capture the union of
+    every condition's area once per poll and hand each condition its own part of that capture.
+    """
+
+    def __init__(self, rct, name=''):
+        """
+        :param rct: Tuple (left, top, right, bottom) area of the screen the condition looks at.
+        :param name: Optional name to tell the conditions apart in the results.
+        """
+        self.rct = tuple(int(v) for v in rct)
+        self.name = name
+
+    def reset(self):
+        """
+        Forgets anything remembered from an earlier wait. Called when a wait starts.
+        :return: void
+        """
+        pass
+
+    def evaluate(self, frame, left, top, now):
+        """
+        Checks the condition against a capture that covers its area.
+        :param frame: RGB image array of the captured area.
+        :param left: The screen x coordinate of the capture's first column.
+        :param top: The screen y coordinate of the capture's first row.
+        :param now: The time.monotonic() time of the capture.
+        :return: Boolean
+        """
+        l, t, r, b = self.rct
+        return self.check(frame[t - top:b - top, l - left:r - left], now)
+
+    @abstractmethod
+    def check(self, img, now):
+        """
+        Checks the condition against the capture of its own area.
+        :param img: RGB image array of the condition's area.
+        :param now: The time.monotonic() time of the capture.
+        :return: Boolean
+        """
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, self.name or "%s,%s,%s,%s" % self.rct)
+
+
+class ColorAt(Condition):
+    """
+    Holds when the pixel at a point has the specified color.
+    """
+
+    def __init__(self, pt, rgb, threshold=1, name=''):
+        """
+        :param pt: The point on the screen to look at.
+        :param rgb: The color we are looking for.
+        :param threshold: The percentile matching threshold, as in DelayConfig.
+        :param name: Optional name to tell the conditions apart in the results.
+        """
+
+        if threshold > 1 or threshold < 0:  # Raise exception for values that are out of bounds.
+            raise ValueError('The parameter "percent" may only contain percentile values between 0 and 1. (For '
+                             'example .25, .66, .8, ect.)')
+
+        super().__init__((pt[0], pt[1], pt[0] + 1, pt[1] + 1), name)
+        self.rgb = tuple(rgb[:3])
+        self.threshold = threshold
+
+    def check(self, img, now):
+        clr = img[0, 0, :3]
+        if self.threshold == 1:
+            return tuple(int(v) for v in clr) == self.rgb
+
+        # The same bounds wait_for_color uses.
+        low = np.asarray(self.rgb, dtype=np.float64) * self.threshold
+        high = np.asarray(self.rgb, dtype=np.float64) * (1 - self.threshold) + 1
+        return bool(np.all((low < clr) & (clr < high)))
+
+
+class ImageAt(Condition):
+    """
+    Holds when the area at a point looks like the specified image, compared the way wait_for_image compares it.
+    """
+
+    def __init__(self, pt, file, threshold=1, name=''):
+        """
+        :param pt: The top left point on the screen where the image should appear.
+        :param file: The image file to use for a comparison.
+        :param threshold: The percentile matching threshold, as in DelayConfig.
+        :param name: Optional name to tell the conditions apart in the results.
+        """
+
+        if file is None or file == '':
+            raise FileNotFoundError("The parameter 'file' must be populated.")
+
+        self.template = TemplateCache.get(file)
+        h, w = self.template.rgb.shape[:2]
+        super().__init__((pt[0], pt[1], pt[0] + w, pt[1] + h), name or file)
+        self.threshold = threshold
+
+    def check(self, img, now):
+        # noinspection PyProtectedMember
+        return self.threshold <= Screen._compare_image(self.template.rgb, img, self.template.hist)
+
+
+class ImageIn(Condition):
+    """
+    Holds when the specified image appears anywhere in an area. The matches are kept in the matches property.
+    """
+
+    def __init__(self, file, rct=None, threshold=0.9, name=''):
+        """
+        :param file: The image file to search for.
+        :param rct: Tuple area rectangle to search in. Defaults to the whole screen.
+        :param threshold: The matching threshold to use when searching, as in Screen.find_image.
+        :param name: Optional name to tell the conditions apart in the results.
+        """
+
+        if file is None or file == '':
+            raise FileNotFoundError("The parameter 'file' must be populated.")
+
+        if rct is None:
+            rct = (0, 0) + tuple(_Platform_Convergence.size())
+
+        super().__init__(rct, name or file)
+        self.template = TemplateCache.get(file)
+        self.threshold = threshold
+        self.matches = list()
+
+    def reset(self):
+        self.matches = list()
+
+    def check(self, img, now):
+        needle = self.template.gray
+        if img.shape[0] < needle.shape[0] or img.shape[1] < needle.shape[1]:
+            return False
+
+        haystack = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # noinspection PyProtectedMember
+        xs, ys, scores = Screen._match(haystack, needle, self.threshold, self.rct[0], self.rct[1])
+        if len(xs) == 0:
+            return False
+
+        h, w = needle.shape[:2]
+        # noinspection PyProtectedMember
+        self.matches = Screen._build_matches(xs, ys, scores, w, h, ScreenConfig.overlap, ScreenConfig.max_results)
+        return True
+
+
+class RegionChanged(Condition):
+    """
+    Holds once an area looks different from how it looked when the wait started.
+    """
+
+    def __init__(self, rct, name=''):
+        """
+        :param rct: The rectangular area of the screen to watch.
+        :param name: Optional name to tell the conditions apart in the results.
+        """
+        super().__init__(rct, name)
+        self._first = None
+
+    def reset(self):
+        self._first = None
+
+    def check(self, img, now):
+        if self._first is None:
+            self._first = img.copy()
+            return False
+
+        # noinspection PyProtectedMember
+        return Screen._compare_image(self._first, img) != 1
+
+
+class RegionStable(Condition):
+    """
+    Holds once an area has stopped changing for the specified amount of time.
+    """
+
+    def __init__(self, rct, settle_time=0.5, tolerance=0, downsample=1, name=''):
+        """
+        :param rct: The rectangular area of the screen to watch.
+        :param settle_time: How long in seconds the area must stay the same.
+        :param tolerance: How different two captures may be and still count as the same, as the mean absolute
+        difference of their pixels between 0 and 1. Zero means the pixels must be identical.
+        :param downsample: Only every n-th pixel in both directions is compared, to keep the diff cheap on big areas.
+        :param name: Optional name to tell the conditions apart in the results.
+        """
+
+        if tolerance > 1 or tolerance < 0:  # Raise exception for values that are out of bounds.
+            raise ValueError('The parameter "tolerance" may only contain values between 0 and 1.')
+        if downsample < 1:
+            raise ValueError('The parameter "downsample" must be at least 1.')
+
+        super().__init__(rct, name)
+        self.settle_time = settle_time
+        self.tolerance = tolerance
+        self.downsample = int(downsample)
+        self._last = None
+        self._since = None
+
+    def reset(self):
+        self._last = None
+        self._since = None
+
+    def check(self, img, now):
+        sample = img[::self.downsample, ::self.downsample] if self.downsample > 1 else img
+
+        # Compare against the capture the quiet period started with, so slow drift within the tolerance still adds up.
+        if self._last is None or self._changed(self._last, sample):
+            self._last = sample.copy()
+            self._since = now
+            return False
+
+        return now - self._since >= self.settle_time
+
+    def _changed(self, img1, img2):
+        if img1.shape != img2.shape:
+            return True
+        if self.tolerance == 0:
+            return not np.array_equal(img1, img2)
+        return cv2.absdiff(img1, img2).mean() / 255 > self.tolerance
 
 
 class Delays:
+    _last_wait = threading.local()
+
     @staticmethod
     def wait(seconds):
         """
@@ -25,6 +362,15 @@ class Delays:
         """
         time.sleep(seconds)
 
+    @staticmethod
+    async def wait_async(seconds):
+        """
+        Waits for the specified number of seconds without blocking the event loop.
+        :param seconds: The amount of time to wait in seconds.
+        :return: None
+        """
+        await asyncio.sleep(seconds)
+
     @staticmethod
     def wait_for_color(pt, rgb, config=None):
         """
@@ -35,36 +381,73 @@ class Delays:
         :return: Boolean
         """
 
-        response = False
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        response = Delays._poll(poller, Delays._color_probe(pt, rgb, config))
+
+        return Delays._done("wait_for_color", response, poller, config,
+                            "%s,%s:%s,%s,%s" % (pt[0], pt[1], rgb[0], rgb[1], rgb[2]))
+
+    @staticmethod
+    async def wait_for_color_async(pt, rgb, config=None):
+        """
+        Waits for the specified color at the specified location. The polls run in an executor and the wait yields to
+        the event loop between them. Cancelling the task aborts the wait.
+        :param pt: The point on the screen to look for pixel color change.
+        :param rgb: The color we are looking for.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
 
         if config is None:
             config = DelayConfig()
 
-        end = time.time() + config.timeout
-        while time.time() < end:
-            clr = Screen.get_pixel_color(pt)
-            if config.threshold == 1:  # If match threshold is 100% do simple comparison.
-                if clr == rgb:
-                    return True  # Return true on matching color.
-            elif config.threshold > 1 or config.threshold < 0:  # Raise exception for values that are out of bounds.
-                raise ValueError('The parameter "percent" may only contain percentile values between 0 and 1. (For '
-                                 'example .25, .66, .8, ect.)')
-            else:  # If threshold is set to another value do more complicated comparison.
-                r1 = rgb[0] * config.threshold
-                g1 = rgb[1] * config.threshold
-                b1 = rgb[2] * config.threshold
-                r2 = rgb[0] * (1 - config.threshold) + 1
-                g2 = rgb[1] * (1 - config.threshold) + 1
-                b2 = rgb[2] * (1 - config.threshold) + 1
-                if r1 < clr[0] < r2 and g1 < clr[1] < g2 and b1 < clr[2] < b2:
-                    response = True
-                    break
+        poller = Poller(config)
+        response = await Delays._poll_async(poller, Delays._color_probe(pt, rgb, config))
 
-        # noinspection PyProtectedMember
-        _Platform_Convergence._log_screenshot(config.log_screenshot, "wait_for_color",
-                                              "%s,%s:%s,%s,%s" % (pt[0], pt[1], rgb[0], rgb[1], rgb[2]), folder=".")
+        return Delays._done("wait_for_color_async", response, poller, config,
+                            "%s,%s:%s,%s,%s" % (pt[0], pt[1], rgb[0], rgb[1], rgb[2]))
 
-        return response
+    @staticmethod
+    def wait_for_colors(pts, rgbs, match_all=True, config=None):
+        """
+        Waits for the specified colors at the specified locations. Every poll reads all the points from one capture.
+        :param pts: The list of points on the screen to look for pixel color changes.
+        :param rgbs: The list of colors we are looking for, one per point, or a single color for every point.
+        :param match_all: If true waits for every point to match, otherwise waits for any one of them.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        response = Delays._poll(poller, Delays._colors_probe(pts, rgbs, match_all, config))
+
+        return Delays._done("wait_for_colors", response, poller, config, "%s" % len(pts))
+
+    @staticmethod
+    async def wait_for_colors_async(pts, rgbs, match_all=True, config=None):
+        """
+        Waits for the specified colors at the specified locations. The polls run in an executor and the wait yields to
+        the event loop between them. Cancelling the task aborts the wait.
+        :param pts: The list of points on the screen to look for pixel color changes.
+        :param rgbs: The list of colors we are looking for, one per point, or a single color for every point.
+        :param match_all: If true waits for every point to match, otherwise waits for any one of them.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        response = await Delays._poll_async(poller, Delays._colors_probe(pts, rgbs, match_all, config))
+
+        return Delays._done("wait_for_colors_async", response, poller, config, "%s" % len(pts))
 
     @staticmethod
     def wait_for_image(pt, file, config=None):
@@ -76,35 +459,35 @@ class Delays:
         :return: Boolean
         """
 
-        response = False
-
-        if file is None or file == '':
-            raise FileNotFoundError("The parameter 'file' must be populated.")
-
         if config is None:
             config = DelayConfig()
 
-        # Load the image file to look for.
-        img = cv2.imread(file)
-        img1 = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        probe = Delays._image_probe(pt, file, config)
+        poller = Poller(config)
+        response = Delays._poll(poller, probe)
 
-        end = time.time() + config.timeout
-        y = pt[1] + img1.shape[0]
-        x = pt[0] + img1.shape[1]
-        while time.time() < end:
-            img2 = Screen.capture((pt[0], pt[1], x, y))
+        return Delays._done("wait_for_image", response, poller, config, "%s,%s" % pt)
 
-            # noinspection PyProtectedMember
-            threshold = Screen._compare_image(img1, img2)
+    @staticmethod
+    async def wait_for_image_async(pt, file, config=None):
+        """
+        Waits for the screen to update to something similar to the specified image at the specified point of the screen.
+        The captures and comparisons run in an executor and the wait yields to the event loop between them. Cancelling
+        the task aborts the wait.
+        :param pt: The point on the screen to look for an update at.
+        :param file: The image file to use for a comparison.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
 
-            if config.threshold <= threshold:
-                response = True
-                break
+        if config is None:
+            config = DelayConfig()
 
-        # noinspection PyProtectedMember
-        _Platform_Convergence._log_screenshot(config.log_screenshot, "wait_for_image", "%s,%s" % pt, folder=".")
+        probe = Delays._image_probe(pt, file, config)
+        poller = Poller(config)
+        response = await Delays._poll_async(poller, probe)
 
-        return response
+        return Delays._done("wait_for_image_async", response, poller, config, "%s,%s" % pt)
 
     @staticmethod
     def wait_for_change(rct, config=None):
@@ -120,18 +503,412 @@ class Delays:
         if config is None:
             config = DelayConfig()
 
+        watcher = Delays._get_damage_watcher() if config.use_damage else None
+        if watcher is not None:
+            watcher.start()  # Only damage from after the first capture counts.
+
+        try:
+            probe = Delays._change_probe(rct)
+
+            poller = Poller(config)
+            if watcher is None:
+                response = Delays._poll(poller, probe)
+            else:
+                # Sleep until the X server reports drawing over the area, and only then compare pixels.
+                while watcher.wait(rct, poller.remaining()):
+                    poller.polls += 1
+                    if probe()[1]:
+                        response = True
+                        break
+        finally:
+            if watcher is not None:
+                watcher.stop()
+
+        return Delays._done("wait_for_change", response, poller, config, "%s,%s,%s,%s" % rct)
+
+    @staticmethod
+    async def wait_for_change_async(rct, config=None):
+        """
+        Watches an area of the screen and waits for something to change. The captures run in an executor and the wait
+        yields to the event loop between them. Cancelling the task aborts the wait.
+        :param rct: The rectangular area of the screen to watch.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        loop = asyncio.get_running_loop()
+        probe = await loop.run_in_executor(None, Delays._change_probe, rct)
+
+        poller = Poller(config)
+        response = await Delays._poll_async(poller, probe)
+
+        return Delays._done("wait_for_change_async", response, poller, config, "%s,%s,%s,%s" % rct)
+
+    @staticmethod
+    def wait_for_stable(rct, settle_time=0.5, tolerance=0, downsample=1, config=None):
+        """
+        Waits for an area of the screen to stop changing, such as an application that has finished rendering.
+        :param rct: The rectangular area of the screen to watch.
+        :param settle_time: How long in seconds the area must stay the same.
+        :param tolerance: How different two captures may be and still count as the same, as the mean absolute
+        difference of their pixels between 0 and 1.
+        :param downsample: Only every n-th pixel in both directions is compared, to keep the diff cheap on big areas.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Delays._stable_poller(settle_time, config)
+        response = Delays._poll(poller, Delays._stable_probe(rct, settle_time, tolerance, downsample))
+
+        return Delays._done("wait_for_stable", response, poller, config, "%s,%s,%s,%s" % rct)
+
+    @staticmethod
+    async def wait_for_stable_async(rct, settle_time=0.5, tolerance=0, downsample=1, config=None):
+        """
+        Waits for an area of the screen to stop changing. The captures run in an executor and the wait yields to the
+        event loop between them. Cancelling the task aborts the wait.
+        :param rct: The rectangular area of the screen to watch.
+        :param settle_time: How long in seconds the area must stay the same.
+        :param tolerance: How different two captures may be and still count as the same, as the mean absolute
+        difference of their pixels between 0 and 1.
+        :param downsample: Only every n-th pixel in both directions is compared, to keep the diff cheap on big areas.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Boolean
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Delays._stable_poller(settle_time, config)
+        response = await Delays._poll_async(poller, Delays._stable_probe(rct, settle_time, tolerance, downsample))
+
+        return Delays._done("wait_for_stable_async", response, poller, config, "%s,%s,%s,%s" % rct)
+
+    @staticmethod
+    def wait_for_any(conditions, config=None):
+        """
+        Waits for any one of the specified conditions. Every poll captures the area covering all the conditions once.
+        :param conditions: The list of Condition objects to wait for.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: ConditionResult(fired, elapsed) with the conditions that held, or None on a timeout.
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        fired = Delays._poll(poller, Delays._conditions_probe(conditions, False))
+
+        return Delays._done("wait_for_any", Delays._condition_result(fired, poller), poller, config,
+                            "%s" % len(conditions))
+
+    @staticmethod
+    async def wait_for_any_async(conditions, config=None):
+        """
+        Waits for any one of the specified conditions. The captures and evaluations run in an executor and the wait
+        yields to the event loop between them. Cancelling the task aborts the wait.
+        :param conditions: The list of Condition objects to wait for.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: ConditionResult(fired, elapsed) with the conditions that held, or None on a timeout.
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        fired = await Delays._poll_async(poller, Delays._conditions_probe(conditions, False))
+
+        return Delays._done("wait_for_any_async", Delays._condition_result(fired, poller), poller, config,
+                            "%s" % len(conditions))
+
+    @staticmethod
+    def wait_for_all(conditions, config=None):
+        """
+        Waits for all the specified conditions to hold in the same capture. Every poll captures the area covering all
+        the conditions once.
+        :param conditions: The list of Condition objects to wait for.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: ConditionResult(fired, elapsed) with every condition, or None on a timeout.
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        fired = Delays._poll(poller, Delays._conditions_probe(conditions, True))
+
+        return Delays._done("wait_for_all", Delays._condition_result(fired, poller), poller, config,
+                            "%s" % len(conditions))
+
+    @staticmethod
+    async def wait_for_all_async(conditions, config=None):
+        """
+        Waits for all the specified conditions to hold in the same capture. The captures and evaluations run in an
+        executor and the wait yields to the event loop between them. Cancelling the task aborts the wait.
+        :param conditions: The list of Condition objects to wait for.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: ConditionResult(fired, elapsed) with every condition, or None on a timeout.
+        """
+
+        if config is None:
+            config = DelayConfig()
+
+        poller = Poller(config)
+        fired = await Delays._poll_async(poller, Delays._conditions_probe(conditions, True))
+
+        return Delays._done("wait_for_all_async", Delays._condition_result(fired, poller), poller, config,
+                            "%s" % len(conditions))
+
+    @staticmethod
+    def last_wait():
+        """
+        Returns how the calling thread's most recent wait went: its name, result, number of polls and duration.
+        :return: WaitStats or None
+        """
+        return getattr(Delays._last_wait, "stats", None)
+
+    # region PROBES
+    # A probe does one poll of a wait. It returns the watched state, for the poller's backoff, and the wait's result
+    # once the thing being waited for has happened. The sync and async waits share them.
+
+    @staticmethod
+    def _color_probe(pt, rgb, config):
+        def probe():
+            clr = Screen.get_pixel_color(pt)
+            if config.threshold == 1:  # If match threshold is 100% do simple comparison.
+                return clr, clr == rgb
+            elif config.threshold > 1 or config.threshold < 0:  # Raise exception for values that are out of bounds.
+                raise ValueError('The parameter "percent" may only contain percentile values between 0 and 1. (For '
+                                 'example .25, .66, .8, ect.)')
+            else:  # If threshold is set to another value do more complicated comparison.
+                r1 = rgb[0] * config.threshold
+                g1 = rgb[1] * config.threshold
+                b1 = rgb[2] * config.threshold
+                r2 = rgb[0] * (1 - config.threshold) + 1
+                g2 = rgb[1] * (1 - config.threshold) + 1
+                b2 = rgb[2] * (1 - config.threshold) + 1
+                return clr, r1 < clr[0] < r2 and g1 < clr[1] < g2 and b1 < clr[2] < b2
+
+        return probe
+
+    @staticmethod
+    def _colors_probe(pts, rgbs, match_all, config):
+        if config.threshold > 1 or config.threshold < 0:  # Raise exception for values that are out of bounds.
+            raise ValueError('The parameter "percent" may only contain percentile values between 0 and 1. (For '
+                             'example .25, .66, .8, ect.)')
+
+        targets = np.asarray(rgbs, dtype=np.float64)[..., :3]
+        if targets.ndim == 1:
+            targets = np.tile(targets, (len(pts), 1))
+
+        # The same bounds wait_for_color uses, computed once for every point.
+        low = targets * config.threshold
+        high = targets * (1 - config.threshold) + 1
+
+        def probe():
+            # noinspection PyProtectedMember
+            colors = Screen._grab_points(pts)[:, :3]
+            if config.threshold == 1:  # If match threshold is 100% do simple comparison.
+                matches = np.all(colors == targets, axis=1)
+            else:
+                matches = np.all((low < colors) & (colors < high), axis=1)
+
+            return colors, bool(matches.all() if match_all else matches.any())
+
+        return probe
+
+    @staticmethod
+    def _image_probe(pt, file, config):
+        if file is None or file == '':
+            raise FileNotFoundError("The parameter 'file' must be populated.")
+
+        # Load the image file to look for.
+        template = TemplateCache.get(file)
+        img1 = template.rgb
+
+        y = pt[1] + img1.shape[0]
+        x = pt[0] + img1.shape[1]
+
+        def probe():
+            img2 = Screen.capture((pt[0], pt[1], x, y))
+            # noinspection PyProtectedMember
+            threshold = Screen._compare_image(img1, img2, template.hist)
+            return img2, bool(config.threshold <= threshold)
+
+        return probe
+
+    @staticmethod
+    def _change_probe(rct):
         img1 = Screen.capture(rct)
 
-        end = time.time() + config.timeout
-        while time.time() < end:
+        def probe():
             img2 = Screen.capture(rct)
             # noinspection PyProtectedMember
             threshold = Screen._compare_image(img1, img2)
-            if threshold != 1:
-                response = True
-                break
+            return img2, bool(threshold != 1)
+
+        return probe
+
+    @staticmethod
+    def _stable_probe(rct, settle_time, tolerance, downsample):
+        condition = RegionStable(rct, settle_time, tolerance, downsample)
+
+        def probe():
+            # noinspection PyProtectedMember
+            img = Screen._grab(condition.rct)
+            # No state for the poller: it shouldn't speed up while the area is still changing, only back off to its cap.
+            return None, condition.check(img, time.monotonic())
+
+        return probe
+
+    @staticmethod
+    def _conditions_probe(conditions, match_all):
+        conditions = list(conditions)
+        if len(conditions) == 0:
+            raise ValueError("The parameter 'conditions' must contain at least one condition.")
+
+        for condition in conditions:
+            condition.reset()
+
+        # The union of every area, captured once per poll.
+        rcts = np.array([condition.rct for condition in conditions])
+        union = (int(rcts[:, 0].min()), int(rcts[:, 1].min()), int(rcts[:, 2].max()), int(rcts[:, 3].max()))
+
+        def probe():
+            # noinspection PyProtectedMember
+            frame = Screen._grab(union)
+            now = time.monotonic()
+
+            # Every condition sees every frame, since the change and stability conditions track the area over time.
+            fired = [condition for condition in conditions if condition.evaluate(frame, union[0], union[1], now)]
+
+            if len(fired) == len(conditions) if match_all else len(fired) > 0:
+                return frame, fired
+            return frame, None
+
+        return probe
+
+    # endregion
+
+    @staticmethod
+    def _poll(poller, probe):
+        """
+        Runs a probe at the pace of the poller until it returns a result or the wait times out.
+        :param poller: The poller that paces the wait.
+        :param probe: The function that does one poll.
+        :return: The probe's result, or False on a timeout.
+        """
+
+        while poller.next():
+            state, result = probe()
+            poller.observe(state)
+            if result:
+                return result
+
+        return False
+
+    @staticmethod
+    async def _poll_async(poller, probe):
+        """
+        Runs a probe in an executor at the pace of the poller until it returns a result or the wait times out. The event
+        loop is free between polls, and cancelling the task raises CancelledError at the next await.
+        :param poller: The poller that paces the wait.
+        :param probe: The function that does one poll.
+        :return: The probe's result, or False on a timeout.
+        """
+
+        loop = asyncio.get_running_loop()
+        while await poller.next_async():
+            state, result = await loop.run_in_executor(None, probe)
+            poller.observe(state)
+            if result:
+                return result
+
+        return False
+
+    @staticmethod
+    def _stable_poller(settle_time, config):
+        """
+        Creates the poller for wait_for_stable. The backoff is capped at a fraction of the settle time, so the wait
+        notices the area has settled soon after it has.
+        """
+        poller = Poller(config)
+        poller.max_interval = max(poller.min_interval, min(poller.max_interval, settle_time / 4))
+        return poller
+
+    @staticmethod
+    def _condition_result(fired, poller):
+        return ConditionResult(fired, poller.elapsed()) if fired else None
+
+    @staticmethod
+    def _done(name, response, poller, config, log_args):
+        """
+        Finishes a wait: records its statistics and logs the screenshot.
+        :param name: The name of the wait function.
+        :param response: What the wait function returns.
+        :param poller: The poller that paced the wait.
+        :param config: The configuration object of the wait.
+        :param log_args: The arguments to write in the screenshot log.
+        :return: The response.
+        """
+
+        Delays._finish(name, response, poller)
 
         # noinspection PyProtectedMember
-        _Platform_Convergence._log_screenshot(config.log_screenshot, "wait_for_change", "%s,%s,%s,%s" % rct, folder=".")
+        _Platform_Convergence._log_screenshot(config.log_screenshot, name, log_args, folder=".")
 
         return response
+
+    @staticmethod
+    def _get_damage_watcher():
+        """
+        Returns the calling thread's X DAMAGE watcher, creating it on first use.
+        :return: DamageWatcher, or None if DAMAGE notifications aren't available.
+        """
+
+        global _damage_supported
+
+        if _damage_supported is False:
+            return None
+
+        watcher = getattr(_damage_watchers, "watcher", None)
+        if watcher is None:
+            if not sys.platform.startswith('linux'):
+                _damage_supported = False
+                return None
+
+            try:
+                from _Damage_X11 import DamageWatcher, DamageUnavailableError
+            except ImportError:  # No python-xlib, or one without the DAMAGE extension; poll from now on.
+                _damage_supported = False
+                return None
+
+            try:
+                watcher = DamageWatcher()
+            except DamageUnavailableError:  # The server can't report damage; poll from now on.
+                _damage_supported = False
+                return None
+            except Exception:  # Couldn't connect this time; poll for this wait and try again on the next one.
+                return None
+
+            _damage_supported = True
+            _damage_watchers.watcher = watcher
+
+        return watcher
+
+    @staticmethod
+    def _finish(name, response, poller):
+        """
+        Records the statistics of a finished wait for last_wait().
+        :param name: The name of the wait function.
+        :param response: What the wait function returns.
+        :param poller: The poller that paced the wait.
+        :return: void
+        """
+        Delays._last_wait.stats = WaitStats(name, response, poller.polls, poller.elapsed())
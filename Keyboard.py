@@ -242,6 +242,7 @@ class Keyboard:
     # region PUBLIC METHODS
     @staticmethod
     @dispatch(str)
+    @_Platform_Convergence.action()
     def press(key, presses=1, config=None):
         """
         Presses the specified key.
@@ -260,6 +261,7 @@ class Keyboard:
 
     @staticmethod
     @dispatch(str, str)
+    @_Platform_Convergence.action()
     def press(key, command_key, presses=1, config=None):
         """
         Presses the specified key.
@@ -281,6 +283,7 @@ class Keyboard:
 
     @staticmethod
     @dispatch(str, tuple)
+    @_Platform_Convergence.action()
     def press(key, command_keys, presses=1, config=None):
         """
         Presses the specified key.
@@ -302,6 +305,7 @@ class Keyboard:
 
     @staticmethod
     @dispatch(str)
+    @_Platform_Convergence.action()
     def type_keys(text, config=None):
         """
         Types the specified text.
@@ -319,6 +323,7 @@ class Keyboard:
 
     @staticmethod
     @dispatch(str, str)
+    @_Platform_Convergence.action()
     def type_keys(text, command_key, config=None):
         """
         Types the specified text.
@@ -339,6 +344,7 @@ class Keyboard:
 
     @staticmethod
     @dispatch(str, tuple)
+    @_Platform_Convergence.action()
     def type_keys(text, command_keys, config=None):
         """
         Types the specified text.
@@ -22,7 +22,6 @@
 # endregion
 import pytweening
 import _Platform_Convergence
-from _Widget import Widget
 
 
 # Constants for the mouse button names:
@@ -170,6 +169,7 @@ class MouseConfig:
 # noinspection GrazieInspection
 class Mouse:
     @staticmethod
+    @_Platform_Convergence.action()
     def move(pt, config=None):
         """
         Moves the mouse to the specified point.
@@ -182,6 +182,7 @@ class Mouse:
             config = MouseConfig()
 
         if config.use_widgets:
+            from _Widget import Widget  # Imported here so that tkinter only loads when widgets are used.
             if pt is None:
                 pt = Mouse.position()
             Widget.show_widget_pt(pt, config.widget_duration)
@@ -190,6 +191,7 @@ class Mouse:
                                       config.pause_after)
 
     @staticmethod
+    @_Platform_Convergence.action()
     def click(pt=None, clicks=1, interval=0.0, button=Btn.PRIMARY, config=None):
         """
         Move to the point (if specified) and clicks the specified mouse button.
@@ -206,6 +208,7 @@ class Mouse:
                                     config.log_screenshot, config.pause_after)
 
     @staticmethod
+    @_Platform_Convergence.action()
     def down(pt=None, button=Btn.PRIMARY, config=None):
         """
         Move to the point (if specified) and presses the specified mouse button down.
@@ -219,6 +222,7 @@ class Mouse:
         _Platform_Convergence.mouse_down(x, y, button, config.tween, config.log_screenshot, config.pause_after)
 
     @staticmethod
+    @_Platform_Convergence.action()
     def up(pt=None, button=Btn.PRIMARY, config=None):
         """
         Move to the point (if specified) and releases the specified mouse button.
@@ -232,6 +236,7 @@ class Mouse:
         _Platform_Convergence.mouse_up(x, y, button, config.tween, config.log_screenshot, config.pause_after)
 
     @staticmethod
+    @_Platform_Convergence.action()
     def scroll(clicks=1, pt=None, config=None):
         """
         Clicks the scroll wheel on the mouse. Positive number scrolls up, negative number scrolls down.
@@ -258,6 +263,7 @@ class Mouse:
         print()
 
     @staticmethod
+    @_Platform_Convergence.action()
     def drag(start_pt, end_pt, button=Btn.PRIMARY, config=None):
         """
         Moves to the start point, clicks and drags to the end point and releases the mouse.
@@ -272,6 +278,7 @@ class Mouse:
             config = MouseConfig()
 
         if config.use_widgets:
+            from _Widget import Widget
             if start_pt is None:
                 start_pt = Mouse.position()
 
@@ -309,6 +316,7 @@ class Mouse:
             config = MouseConfig()
 
         if config.use_widgets:
+            from _Widget import Widget
             if pt is None:
                 pt = Mouse.position()
 
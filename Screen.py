@@ -20,13 +20,31 @@
  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 # endregion
+import asyncio
+import collections
 import cv2
 import numpy as np
+import os
+import sys
+import threading
 import time
 import _Platform_Convergence
+from concurrent.futures import ThreadPoolExecutor
 from _Widget import Widget
 from PIL import ImageGrab
-from tkinter import *
+
+# region TWEAK-ABLE SETTINGS
+# If True, captures on X11 go through a persistent MIT-SHM segment instead of opening a new connection through
+# PIL.ImageGrab for every frame. ImageGrab is still used whenever the shared memory backend isn't available.
+USE_SHM_CAPTURE = True
+
+# Exact searches of areas with at least this many pixels are split into tiles matched on ScreenConfig.workers threads.
+MIN_TILED_PIXELS = 1920 * 1080
+# endregion
+
+_shm_capture = None  # The shared memory capture backend. None until first use, False if it couldn't be created.
+_pools = {}  # The thread pools the matching functions share, one per worker count. Created on first use.
+_pool_lock = threading.Lock()
 
 
 class ScreenConfig:
@@ -36,11 +54,24 @@ class ScreenConfig:
     :prop widget_duration: How long to display the widget on the screen.
     :prop log_screenshot: If true the method takes a screenshot after the action.
     :prop pause_after: How many seconds to pause after the operation ahs been performed.
+    :prop workers: How many threads image matching may use, across images or across tiles of a large screen. None uses
+    one per CPU.
+    :prop pyramid_levels: How many times find_image halves the screen and image for a coarse search before verifying
+    candidates at full resolution. 0 searches the full resolution screen directly.
+    :prop pyramid_tolerance: How far below the threshold a coarse match may score and still be verified.
+    :prop overlap: The largest intersection over union two find_image results may share. Overlapping locations are
+    reduced to the best scoring one. None returns every location that meets the threshold.
+    :prop max_results: The most results find_image returns, best score first. None for no limit.
     """
     use_widgets = False     # If true displays the field highlighting widget during operation.
     widget_duration = 0.0   # How long to display the widget on the screen.
     log_screenshot = False  # If true the method takes a screenshot after the action.
     pause_after = 0.0       # How many seconds to pause after the operation ahs been performed.
+    workers = None          # How many threads image matching may use. None uses one per CPU.
+    pyramid_levels = 0      # How many times to halve the screen and image for a coarse search. 0 for exact search.
+    pyramid_tolerance = 0.15  # How far below the threshold a coarse match may score and still be verified.
+    overlap = 0.3           # The largest intersection over union two results may share. None keeps every location.
+    max_results = None      # The most results find_image returns, best score first. None for no limit.
 
 
 class Screen:
@@ -56,8 +87,8 @@ class Screen:
         if config is None:
             config = ScreenConfig()
 
-        image = ImageGrab.grab(bbox=(pt[0], pt[1], pt[0] + 1, pt[1] + 1))
-        pixel = image.getpixel((0, 0))
+        image = Screen._grab((pt[0], pt[1], pt[0] + 1, pt[1] + 1), all_screens=False)
+        pixel = tuple(int(c) for c in image[0, 0])
         Screen._handle_widget_pt(pt, config)
 
         # noinspection PyProtectedMember
@@ -66,6 +97,30 @@ class Screen:
 
         return pixel
 
+    @staticmethod
+    def get_pixel_colors(pts, config=None):
+        """
+        Returns the pixel colors of all the specified coordinates, read from a single capture of the area they span.
+        :param pts: The list of points to look at.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Color[]
+        """
+
+        if config is None:
+            config = ScreenConfig()
+
+        pixels = [tuple(int(c) for c in clr) for clr in Screen._grab_points(pts)]
+
+        if config.use_widgets:
+            for pt in pts:
+                Widget.show_widget_pt(pt, config.widget_duration)
+
+        # noinspection PyProtectedMember
+        _Platform_Convergence._log_screenshot(config.log_screenshot, "get_pixel_colors", "%s" % len(pts), folder=".")
+        Screen._pause(config.pause_after)
+
+        return pixels
+
     @staticmethod
     def get_known_color(pt, config=None):
         """
@@ -78,7 +133,7 @@ class Screen:
         if config is None:
             config = ScreenConfig()
 
-        known_colors = KnownColors.get_known_colors()
+        known_colors = KnownColors.get_known_palette()
         Screen._handle_widget_pt(pt, config)
 
         # noinspection PyProtectedMember
@@ -99,7 +154,7 @@ class Screen:
         if config is None:
             config = ScreenConfig()
 
-        console_colors = KnownColors.get_console_colors()
+        console_colors = KnownColors.get_console_palette()
         Screen._handle_widget_pt(pt, config)
 
         # noinspection PyProtectedMember
@@ -108,6 +163,28 @@ class Screen:
 
         return Screen._get_color(pt, console_colors)
 
+    @staticmethod
+    def get_known_colors(rct, config=None):
+        """
+        Classifies every pixel of the specified area as its nearest known color.
+        :param rct: Tuple area rectangle to classify.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Array of indexes into KnownColors.get_known_colors(), one per pixel.
+        """
+
+        return Screen._get_colors(rct, KnownColors.get_known_palette(), "get_known_colors", config)
+
+    @staticmethod
+    def get_console_colors(rct, config=None):
+        """
+        Classifies every pixel of the specified area as its nearest console color.
+        :param rct: Tuple area rectangle to classify.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: Array of indexes into KnownColors.get_console_colors(), one per pixel.
+        """
+
+        return Screen._get_colors(rct, KnownColors.get_console_palette(), "get_console_colors", config)
+
     @staticmethod
     def capture(rct, config=None):
         """
@@ -120,13 +197,22 @@ class Screen:
         if config is None:
             config = ScreenConfig()
 
-        image = ImageGrab.grab(bbox=(rct[0], rct[1], rct[2], rct[3]), all_screens=True)
+        image = Screen._grab(rct)
         Screen._handle_widget_rct(rct, config)
 
         Screen._pause(config.pause_after)
 
-        # noinspection PyTypeChecker
-        return np.array(image)
+        return image
+
+    @staticmethod
+    async def capture_async(rct, config=None):
+        """
+        Captures the area of the specified rectangle in an executor, without blocking the event loop.
+        :param rct: Tuple (left, top, right, bottom) area of the screen to capture.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :return: RGB image array
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, Screen.capture, rct, config)
 
     @staticmethod
     def capture_to_file(rct, file, config=None):
@@ -151,99 +237,465 @@ class Screen:
         return
 
     @staticmethod
-    def find_image(file, threshold=0.9, config=None):
+    def find_image(file, threshold=0.9, config=None, rct=None):
         """
         Searches the screen to locate image matches of the specified image file.
         :param file: The name of the file to load reference image from.
         :param threshold: The matching threshold to use when searching.
         :param config: The configuration object that contains setting for how this action should be performed.
-        :return: tuple(x,y,w,h)[]
+        :param rct: Optional tuple area rectangle, or list of them, to limit the search to. Defaults to the whole
+        screen.
+        :return: Match[]
         """
 
         if file is None or file == '':
             raise FileNotFoundError("The parameter 'file' must be populated.")
 
         # Load the image file to look for.
-        img = cv2.imread(file)
+        needle = TemplateCache.get(file).gray
 
-        # region Get the screen width and height.
-        tkr = Tk()
-        width = tkr.winfo_screenwidth()
-        height = tkr.winfo_screenheight()
-        # endregion
+        if config is None:
+            config = ScreenConfig()
 
-        # Capture the screen.
-        # noinspection PyTypeChecker
-        screen = np.array(ImageGrab.grab(bbox=(0, 0, width, height), all_screens=True))
+        lst = Screen._find({file: needle}, threshold, rct, config)[file]
 
-        # region Search for image file on screen and return found locations.
-        haystack = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
-        needle = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        w, h = needle.shape[::-1]
-        res = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+        if config.use_widgets:
+            for rect in lst:
+                Widget.show_widget_rect(rect, config.widget_duration)
+
+        # noinspection PyProtectedMember
+        _Platform_Convergence._log_screenshot(config.log_screenshot, "get_console_color", "%s" % threshold, folder=".")
+        Screen._pause(config.pause_after)
 
-        loc = np.where(res >= threshold)
+        return lst
+
+    @staticmethod
+    async def find_image_async(file, threshold=0.9, config=None, rct=None):
+        """
+        Searches the screen for the specified image file in an executor, without blocking the event loop.
+        :param file: The name of the file to load reference image from.
+        :param threshold: The matching threshold to use when searching.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :param rct: Optional tuple area rectangle, or list of them, to limit the search to. Defaults to the whole
+        screen.
+        :return: Match[]
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, Screen.find_image, file, threshold, config, rct)
+
+    @staticmethod
+    def find_images(files, threshold=0.9, config=None, rct=None):
+        """
+        Searches the screen for every one of the specified image files. The screen is captured and converted once and
+        the images are matched against it in parallel.
+        :param files: The names of the files to load reference images from.
+        :param threshold: The matching threshold to use when searching.
+        :param config: The configuration object that contains setting for how this action should be performed.
+        :param rct: Optional tuple area rectangle, or list of them, to limit the search to. Defaults to the whole
+        screen.
+        :return: dict(file: Match[])
+        """
+
+        for file in files:
+            if file is None or file == '':
+                raise FileNotFoundError("The parameter 'files' must only contain populated file names.")
+
+        # Load the image files to look for.
+        needles = {file: TemplateCache.get(file).gray for file in files}
 
         if config is None:
             config = ScreenConfig()
 
-        lst = list()
-        for i in range(len(loc[0])):
-            rect = (loc[1][i], loc[0][i], w, h)
-            lst.append(rect)
-            if config.use_widgets:
-                Widget.show_widget_rect(rect, config.widget_duration)
+        results = Screen._find(needles, threshold, rct, config)
+
+        if config.use_widgets:
+            for lst in results.values():
+                for rect in lst:
+                    Widget.show_widget_rect(rect, config.widget_duration)
 
         # noinspection PyProtectedMember
-        _Platform_Convergence._log_screenshot(config.log_screenshot, "get_console_color", "%s" % threshold, folder=".")
+        _Platform_Convergence._log_screenshot(config.log_screenshot, "find_images", "%s" % len(needles), folder=".")
         Screen._pause(config.pause_after)
 
-        return lst
+        return results
+
+    @staticmethod
+    def _find(needles, threshold, rct, config):
+        """
+        Captures each search area once and matches every needle against it.
+        :param needles: dict(key: grayscale image) of the images to search for.
+        :param threshold: The matching threshold to use when searching.
+        :param rct: None for the whole screen, a tuple area rectangle or a list of them.
+        :param config: The configuration settings for this operation.
+        :return: dict(key: Match[])
+        """
+
+        found = {key: list() for key in needles}
+
+        for area in Screen._get_search_areas(rct):
+            # Capture only the area being searched.
+            screen = Screen._grab(area)
+            haystack = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
+
+            # Search for each image in the area. (matchTemplate releases the GIL, so the searches run in parallel.)
+            if len(needles) > 1:
+                pool = Screen._get_pool(config.workers)
+                futures = {key: pool.submit(Screen._match, haystack, needle, threshold, area[0], area[1],
+                                            config.pyramid_levels, config.pyramid_tolerance)
+                           for key, needle in needles.items()}
+                for key, future in futures.items():
+                    found[key].append(future.result())
+            else:
+                # With a single image, large areas are split into tiles that are matched in parallel instead.
+                workers = Screen._get_workers(config.workers)
+                pool = Screen._get_pool(workers) if workers > 1 else None
+                for key, needle in needles.items():
+                    found[key].append(Screen._match(haystack, needle, threshold, area[0], area[1],
+                                                    config.pyramid_levels, config.pyramid_tolerance, pool, workers))
+
+        results = dict()
+        for key, needle in needles.items():
+            if not found[key]:
+                results[key] = list()
+                continue
+
+            xs, ys, scores = (np.concatenate(column) for column in zip(*found[key]))
+            h, w = needle.shape[:2]
+            results[key] = Screen._build_matches(xs, ys, scores, w, h, config.overlap, config.max_results)
+
+        return results
+
+    @staticmethod
+    def _build_matches(xs, ys, scores, w, h, overlap=None, max_results=None):
+        """
+        Turns matching locations into Match results.
+        With an overlap, results are reduced to the best scoring match of each cluster of overlapping locations
+        (non-maximum suppression) and sorted by score. Without one, every location is returned in row order.
+        :param xs: The x coordinates of the locations.
+        :param ys: The y coordinates of the locations.
+        :param scores: The matching score of each location.
+        :param w: The width of the image that was searched for.
+        :param h: The height of the image that was searched for.
+        :param overlap: The largest intersection over union two results may share, or None to keep every location.
+        :param max_results: The most results to return, or None for no limit.
+        :return: Match[]
+        """
+
+        # Overlapping search areas can find the same location twice. np.unique also sorts the locations by row.
+        _, index = np.unique(np.stack((ys, xs), axis=1), axis=0, return_index=True)
+        xs, ys, scores = xs[index], ys[index], scores[index]
+
+        if overlap is None:
+            keep = np.arange(len(xs))[:max_results]
+        else:
+            keep = list()
+            order = np.argsort(-scores, kind='stable')
+            area = 2 * w * h
+            while order.size > 0 and (max_results is None or len(keep) < max_results):
+                best = order[0]
+                keep.append(best)
+                rest = order[1:]
+
+                # Every result is the same size, so the intersection only depends on how far apart they are.
+                inter = np.clip(w - np.abs(xs[rest] - xs[best]), 0, None) * \
+                    np.clip(h - np.abs(ys[rest] - ys[best]), 0, None)
+                order = rest[inter <= overlap * (area - inter)]
+
+        return [Match(int(xs[i]), int(ys[i]), w, h, float(scores[i])) for i in keep]
+
+    @staticmethod
+    def _get_workers(workers=None):
+        """
+        Resolves the worker count setting.
+        :param workers: The configured number of worker threads, or None for one per CPU.
+        :return: int
+        """
+
+        if workers is None or workers < 1:
+            return os.cpu_count() or 1
+
+        return workers
+
+    @staticmethod
+    def _get_pool(workers=None):
+        """
+        Returns the thread pool shared by the matching functions with this many workers. A pool is never replaced, since
+        other threads may still be matching on it.
+        :param workers: The number of worker threads. Defaults to the number of CPUs.
+        :return: ThreadPoolExecutor
+        """
+
+        workers = Screen._get_workers(workers)
+
+        with _pool_lock:
+            pool = _pools.get(workers)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="SimpleRPA-Match")
+                _pools[workers] = pool
+
+            return pool
+
+    @staticmethod
+    def _get_search_areas(rct):
+        """
+        Normalizes the search area argument of find_image into a list of rectangles.
+        :param rct: None for the whole screen, a tuple area rectangle or a list of them.
+        :return: tuple(x1,y1,x2,y2)[]
+        """
+
+        if rct is None:
+            width, height = _Platform_Convergence.size()
+            return [(0, 0, width, height)]
+
+        if len(rct) == 0 or isinstance(rct[0], (tuple, list)):
+            return [tuple(area) for area in rct]
+
+        return [tuple(rct)]
+
+    @staticmethod
+    def _match(haystack, needle, threshold, left=0, top=0, pyramid_levels=0, pyramid_tolerance=0.15, pool=None,
+               tiles=1):
+        """
+        Matches the needle against the haystack and returns every location that meets the threshold.
+        :param haystack: The grayscale image to search in.
+        :param needle: The grayscale image to search for.
+        :param threshold: The matching threshold to use when searching.
+        :param left: The screen x coordinate of the haystack's left edge.
+        :param top: The screen y coordinate of the haystack's top edge.
+        :param pyramid_levels: How many times to halve both images for a coarse search first. 0 for an exact search.
+        :param pyramid_tolerance: How far below the threshold a coarse match may score and still be verified.
+        :param pool: If given, large exact searches are split into tiles that are matched on this thread pool. Never
+        pass the pool this call itself is running on; waiting on the tiles could then deadlock.
+        :param tiles: How many tiles to split large exact searches into when a pool is given.
+        :return: tuple(xs, ys, scores) arrays of the matching locations in screen coordinates.
+        """
+
+        h, w = needle.shape[:2]
+        if haystack.shape[0] < h or haystack.shape[1] < w:
+            # The area is smaller than the image, so it can't contain it.
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if pyramid_levels > 0:
+            ys, xs, scores = Screen._locate_pyramid(haystack, needle, threshold, pyramid_levels, pyramid_tolerance)
+        elif pool is not None and tiles > 1 and haystack.shape[0] * haystack.shape[1] >= MIN_TILED_PIXELS:
+            ys, xs, scores = Screen._locate_tiled(haystack, needle, threshold, pool, tiles)
+        else:
+            ys, xs, scores = Screen._locate(haystack, needle, threshold)
+
+        return xs.astype(np.int64) + left, ys.astype(np.int64) + top, scores
+
+    @staticmethod
+    def _locate(haystack, needle, threshold):
+        """
+        Matches the needle against the whole haystack.
+        :param haystack: The grayscale image to search in.
+        :param needle: The grayscale image to search for.
+        :param threshold: The matching threshold to use when searching.
+        :return: tuple(ys, xs, scores) of the matching locations.
+        """
+
+        res = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+        ys, xs = np.where(res >= threshold)
+        return ys, xs, res[ys, xs]
+
+    @staticmethod
+    def _locate_tiled(haystack, needle, threshold, pool, tiles):
+        """
+        Splits the haystack into overlapping strips along its longer side and matches the needle against each strip on
+        the thread pool. Strips overlap by the needle size - 1, so every location is matched exactly once.
+        :param haystack: The grayscale image to search in.
+        :param needle: The grayscale image to search for.
+        :param threshold: The matching threshold to use when searching.
+        :param pool: The thread pool to match the strips on.
+        :param tiles: How many strips to split the haystack into.
+        :return: tuple(ys, xs, scores) of the matching locations. (Strip by strip, so not necessarily in row order.)
+        """
+
+        h, w = needle.shape[:2]
+        res_height = haystack.shape[0] - h + 1
+        res_width = haystack.shape[1] - w + 1
+        vertical = res_width >= res_height
+        length = res_width if vertical else res_height
+        tiles = min(tiles, length)
+
+        futures = list()
+        for i in range(tiles):
+            start = length * i // tiles
+            stop = length * (i + 1) // tiles
+            if vertical:
+                tile = haystack[:, start:stop + w - 1]
+            else:
+                tile = haystack[start:stop + h - 1, :]
+            futures.append((start, pool.submit(Screen._locate, tile, needle, threshold)))
+
+        found = list()
+        for start, future in futures:
+            ys, xs, scores = future.result()
+            if vertical:
+                found.append((ys, xs + start, scores))
+            else:
+                found.append((ys + start, xs, scores))
+
+        return tuple(np.concatenate(column) for column in zip(*found))
+
+    @staticmethod
+    def _locate_pyramid(haystack, needle, threshold, levels, tolerance):
+        """
+        Finds the needle in downscaled copies of both images, then verifies the candidates at full resolution in small
+        windows around them. Returns the same locations as an exact search, as long as every real match still scores
+        within tolerance of the threshold at the coarse level.
+        :param haystack: The grayscale image to search in.
+        :param needle: The grayscale image to search for.
+        :param threshold: The matching threshold to use when searching.
+        :param levels: How many times to halve both images.
+        :param tolerance: How far below the threshold a coarse match may score and still be verified.
+        :return: tuple(ys, xs, scores) of the matching locations.
+        """
+
+        h, w = needle.shape[:2]
+
+        # Don't shrink the needle below 8 pixels; there would be nothing left to match on.
+        while levels > 0 and min(h, w) >> levels < 8:
+            levels -= 1
+
+        if levels == 0:
+            return Screen._locate(haystack, needle, threshold)
+
+        small_haystack = haystack
+        small_needle = needle
+        for _ in range(levels):
+            small_haystack = cv2.pyrDown(small_haystack)
+            small_needle = cv2.pyrDown(small_needle)
+
+        if small_haystack.shape[0] < small_needle.shape[0] or small_haystack.shape[1] < small_needle.shape[1]:
+            return Screen._locate(haystack, needle, threshold)
+
+        coarse = cv2.matchTemplate(small_haystack, small_needle, cv2.TM_CCOEFF_NORMED)
+        candidates = (coarse >= threshold - tolerance).astype(np.uint8)
+        if not candidates.any():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Group neighbouring candidates so each cluster is verified with one full resolution match.
+        count, _, stats, _ = cv2.connectedComponentsWithStats(candidates, connectivity=8)
+
+        res_height = haystack.shape[0] - h + 1
+        res_width = haystack.shape[1] - w + 1
+        scale = 1 << levels
+        found = list()
+        for x, y, bw, bh, _ in stats[1:count]:
+            x0 = max(0, (x - 1) * scale)
+            y0 = max(0, (y - 1) * scale)
+            x1 = min(res_width, (x + bw + 1) * scale)
+            y1 = min(res_height, (y + bh + 1) * scale)
+            if x0 >= x1 or y0 >= y1:
+                continue
+
+            ys, xs, scores = Screen._locate(haystack[y0:y1 + h - 1, x0:x1 + w - 1], needle, threshold)
+            found.append(((ys + y0) * res_width + (xs + x0), scores))
+
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Windows can overlap, so drop duplicates. np.unique also restores the row-major order of an exact search.
+        keys, index = np.unique(np.concatenate([f[0] for f in found]), return_index=True)
+        scores = np.concatenate([f[1] for f in found])[index]
+        return keys // res_width, keys % res_width, scores
+
+    @staticmethod
+    def _grab(rct, all_screens=True):
+        """
+        Captures the area of the specified rectangle, through shared memory when possible and ImageGrab otherwise.
+        :param rct: Tuple (left, top, right, bottom) area of the screen to capture.
+        :param all_screens: Passed on to ImageGrab when falling back to it. (The X11 root always spans every monitor.)
+        :return: RGB image array
+        """
+
+        backend = Screen._get_capture_backend()
+        if backend is not None:
+            image = backend.grab(rct)
+            if image is not None:
+                return image
+
+        # noinspection PyTypeChecker
+        return np.array(ImageGrab.grab(bbox=(rct[0], rct[1], rct[2], rct[3]), all_screens=all_screens))
+
+    @staticmethod
+    def _grab_points(pts):
+        """
+        Captures the bounding box of the specified points once and picks each point's pixel out of it.
+        :param pts: The list of points to look at.
+        :return: Array of one color per point.
+        """
+
+        if len(pts) == 0:
+            return np.empty((0, 3), dtype=np.uint8)
+
+        xy = np.asarray(pts, dtype=np.int64).reshape(-1, 2)
+        left, top = xy.min(axis=0)
+        right, bottom = xy.max(axis=0) + 1
+
+        image = Screen._grab((left, top, right, bottom), all_screens=False)
+        return image[xy[:, 1] - top, xy[:, 0] - left]
 
     @staticmethod
-    def _get_color(pt, color_list):
+    def _get_capture_backend():
+        """
+        Returns the shared memory capture backend, creating it on first use.
+        :return: ShmCapture or None
+        """
+
+        global _shm_capture
+
+        if not USE_SHM_CAPTURE or _shm_capture is False:
+            return None
+
+        if _shm_capture is None:
+            if not sys.platform.startswith('linux'):
+                _shm_capture = False
+                return None
+
+            try:
+                from _Capture_X11 import ShmCapture
+                _shm_capture = ShmCapture()
+            except (ImportError, OSError):
+                _shm_capture = False  # Don't retry on every capture; ImageGrab will be used from now on.
+                return None
+
+        return _shm_capture
+
+    @staticmethod
+    def _get_color(pt, palette):
         """
         Gets the color at the specified point on the screen.
-        :param color_list: The list of known colors to find the closest match to.
+        :param palette: The palette of known colors to find the closest match to.
         :return: Color
         """
 
-        lng = len(color_list)
         p = Screen.get_pixel_color(pt)
-        clr = -1
-        delta = 256
-        m0 = 256
-        m1 = 256
-        m2 = 256
-        c0 = 256
-        c1 = 256
-        c2 = 256
-
-        # region Find the closest match.
-        for i in range(0, lng):
-            c = color_list[i]
-            d0 = abs(c.r - p[0])
-            d1 = abs(c.g - p[1])
-            d2 = abs(c.b - p[2])
-            d = (d0 + d1 + d2) / 3
-
-            if d < delta:
-                delta = d
-                clr = i
-                c0 = d0
-                c1 = d1
-                c2 = d2
-            elif d == delta:
-                if (c0 < m0 and (c1 < m1 or c2 < m2)) or (c1 < m1 and c2 < m2):
-                    delta = d
-                    clr = i
-                    c0 = d0
-                    c1 = d1
-                    c2 = d2
-        # endregion
-
-        return color_list[clr]
-        # endregion
+        index = palette.nearest(np.array([p[:3]], dtype=np.uint8))[0]
+        return palette.colors[index]
+
+    @staticmethod
+    def _get_colors(rct, palette, func_name, config=None):
+        """
+        Captures the area of the specified rectangle and maps each pixel to its nearest palette color.
+        :param rct: Tuple area rectangle to classify.
+        :param palette: The palette of colors to find the closest matches in.
+        :param func_name: The name of the calling function, for the screenshot log.
+        :param config: The configuration settings for this operation.
+        :return: Array of palette indexes, one per pixel.
+        """
+
+        if config is None:
+            config = ScreenConfig()
+
+        labels = palette.nearest(Screen._grab(rct)[:, :, :3])
+        Screen._handle_widget_rct(rct, config)
+
+        # noinspection PyProtectedMember
+        _Platform_Convergence._log_screenshot(config.log_screenshot, func_name, "%s,%s,%s,%s" % tuple(rct), folder=".")
+        Screen._pause(config.pause_after)
+
+        return labels
 
     @staticmethod
     def _handle_widget_pt(pt, config=None):
@@ -282,12 +734,18 @@ class Screen:
             time.sleep(config.pause_after)
 
     @staticmethod
-    def _compare_image(img1, img2):
-        g1 = gray = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-        g2 = gray = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    def _compare_image(img1, img2, h1=None):
+        """
+        Compares two images by their histograms.
+        :param img1: The first image.
+        :param img2: The second image.
+        :param h1: The precomputed histogram of the first image, if it has one. (See Template.hist.)
+        :return: The similarity of the two images between 0 and 1.
+        """
 
-        h1 = cv2.calcHist([img1], [0], None, [256], [0, 256])
-        h2 = cv2.calcHist([img2], [0], None, [256], [0, 256])
+        if h1 is None:
+            h1 = Template.histogram(img1)
+        h2 = Template.histogram(img2)
 
         hist_diff = cv2.compareHist(h1, h2, cv2.HISTCMP_BHATTACHARYYA)
         probability_match = \
@@ -309,6 +767,141 @@ class Screen:
             time.sleep(pause_after)
 
 
+class Match(collections.namedtuple("Match", "x y w h")):
+    """
+    An image location found on the screen. Unpacks like a tuple(x,y,w,h) and carries the matching score.
+    """
+
+    def __new__(cls, x, y, w, h, score=1.0):
+        self = super(Match, cls).__new__(cls, x, y, w, h)
+        self.score = score
+        return self
+
+
+class Template:
+    """
+    A decoded template image along with everything the matching functions precompute from it.
+    """
+
+    def __init__(self, file, bgr, mtime=0):
+        """
+        Initializes a new instance of Template class.
+        :param file: The file the template was loaded from.
+        :param bgr: The decoded image, as returned by cv2.imread.
+        :param mtime: The modification time of the file when it was loaded.
+        """
+        self.file = file
+        self.mtime = mtime
+        self.bgr = bgr
+        self.rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        self.gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        self.hist = Template.histogram(self.rgb)
+        mean, std = cv2.meanStdDev(self.gray)
+        self.mean = float(mean[0][0])
+        self.std = float(std[0][0])
+        self.nbytes = self.bgr.nbytes + self.rgb.nbytes + self.gray.nbytes + self.hist.nbytes
+
+    @staticmethod
+    def histogram(img):
+        """
+        Returns the first channel histogram Screen._compare_image compares images with.
+        :param img: The image.
+        :return: histogram
+        """
+        return cv2.calcHist([img], [0], None, [256], [0, 256])
+
+
+class TemplateCache:
+    """
+    A process wide LRU cache of decoded template images, keyed by file path and modification time.
+    :prop max_bytes: The memory cap; the least recently used templates are evicted beyond it.
+    :prop hits: The number of lookups served from the cache.
+    :prop misses: The number of lookups that had to decode the file.
+    :prop evictions: The number of templates dropped to stay under max_bytes.
+    """
+    max_bytes = 256 * 1024 * 1024
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    _entries = collections.OrderedDict()
+    _bytes = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(file):
+        """
+        Returns the template for the specified file, decoding it only if it isn't cached or has changed on disk.
+        :param file: The name of the image file.
+        :return: Template
+        """
+
+        path = os.path.abspath(file)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            raise FileNotFoundError("The image file '%s' could not be found." % file)
+
+        with TemplateCache._lock:
+            template = TemplateCache._entries.get(path)
+            if template is not None and template.mtime == mtime:
+                TemplateCache._entries.move_to_end(path)
+                TemplateCache.hits += 1
+                return template
+            TemplateCache.misses += 1
+
+        bgr = cv2.imread(path)
+        if bgr is None:
+            raise FileNotFoundError("The image file '%s' could not be read." % file)
+        template = Template(path, bgr, mtime)
+
+        with TemplateCache._lock:
+            old = TemplateCache._entries.pop(path, None)
+            if old is not None:
+                TemplateCache._bytes -= old.nbytes
+
+            TemplateCache._entries[path] = template
+            TemplateCache._bytes += template.nbytes
+
+            # Always keep the template just loaded, even if it's bigger than the cap on its own.
+            while TemplateCache._bytes > TemplateCache.max_bytes and len(TemplateCache._entries) > 1:
+                _, evicted = TemplateCache._entries.popitem(last=False)
+                TemplateCache._bytes -= evicted.nbytes
+                TemplateCache.evictions += 1
+
+        return template
+
+    @staticmethod
+    def stats():
+        """
+        Returns the cache counters, for sizing max_bytes.
+        :return: dict
+        """
+
+        with TemplateCache._lock:
+            return {
+                'hits': TemplateCache.hits,
+                'misses': TemplateCache.misses,
+                'evictions': TemplateCache.evictions,
+                'entries': len(TemplateCache._entries),
+                'bytes': TemplateCache._bytes,
+            }
+
+    @staticmethod
+    def clear():
+        """
+        Empties the cache and resets its counters.
+        :return: void
+        """
+
+        with TemplateCache._lock:
+            TemplateCache._entries.clear()
+            TemplateCache._bytes = 0
+            TemplateCache.hits = 0
+            TemplateCache.misses = 0
+            TemplateCache.evictions = 0
+
+
 class Color:
     """
     Class to manage screen colors.
@@ -333,6 +926,70 @@ class Color:
         self.name = name
 
 
+class Palette:
+    """
+    A fixed list of colors that pixels can be matched to. The nearest color of every RGB value is remembered in a
+    24-bit lookup table, filled in as colors are seen, so repeated lookups cost one array index.
+    """
+
+    _UNKNOWN = 255  # Lookup table entry for a color that hasn't been matched yet. Palettes hold at most 255 colors.
+
+    def __init__(self, colors):
+        """
+        Initializes a new instance of Palette class.
+        :param colors: The list of colors in the palette.
+        """
+        self.colors = tuple(colors)
+        self.rgb = np.array([(c.r, c.g, c.b) for c in self.colors], dtype=np.int16)
+        self._lut = None
+        self._lock = threading.Lock()
+
+    def nearest(self, pixels):
+        """
+        Returns the index of the nearest palette color of each pixel.
+        :param pixels: Array of RGB pixels, of any shape ending in 3.
+        :return: Array of palette indexes in the shape of pixels without its last axis.
+        """
+
+        pixels = np.asarray(pixels, dtype=np.uint8)
+        packed = (pixels[..., 0].astype(np.uint32) << 16) | (pixels[..., 1].astype(np.uint32) << 8) | pixels[..., 2]
+
+        if self._lut is None:
+            with self._lock:
+                if self._lut is None:
+                    self._lut = np.full(1 << 24, Palette._UNKNOWN, dtype=np.uint8)
+
+        labels = self._lut[packed]
+        unknown = labels == Palette._UNKNOWN
+        if unknown.any():
+            # Screens only have a handful of distinct colors, so only those are matched the slow way.
+            colors = np.unique(packed[unknown])
+            self._lut[colors] = self._match(colors)
+            labels = self._lut[packed]
+
+        return labels
+
+    def _match(self, packed):
+        """
+        Finds the nearest palette color of each packed RGB value by comparing it to every palette color.
+        The distance is the sum of the channel differences, and ties go to the later palette color.
+        :param packed: Array of 0xRRGGBB values.
+        :return: Array of palette indexes.
+        """
+
+        labels = np.empty(len(packed), dtype=np.uint8)
+        last = len(self.colors) - 1
+
+        # Work in chunks to keep the distance matrix small.
+        for start in range(0, len(packed), 65536):
+            chunk = packed[start:start + 65536]
+            rgb = np.stack(((chunk >> 16) & 0xFF, (chunk >> 8) & 0xFF, chunk & 0xFF), axis=1).astype(np.int16)
+            distance = np.abs(rgb[:, None, :] - self.rgb[None, :, :]).sum(axis=2)
+            labels[start:start + 65536] = last - np.argmin(distance[:, ::-1], axis=1)
+
+        return labels
+
+
 class KnownColors:
     """
     An enumerated list of known colors.
@@ -478,6 +1135,9 @@ class KnownColors:
     YELLOW = Color(255, 255, 0, 'Yellow')
     YELLOW_GREEN = Color(154, 205, 50, 'YellowGreen')
 
+    _console_palette = None
+    _known_palette = None
+
     @staticmethod
     def get_console_colors():
         """
@@ -485,6 +1145,48 @@ class KnownColors:
         :return: Color[]
         """
 
+        return list(KnownColors.get_console_palette().colors)
+
+    @staticmethod
+    def get_known_colors():
+        """
+        Returns a list of all known colors.
+        :return: Color[]
+        """
+
+        return list(KnownColors.get_known_palette().colors)
+
+    @staticmethod
+    def get_console_palette():
+        """
+        Returns the palette of the 16 console colors.
+        :return: Palette
+        """
+
+        if KnownColors._console_palette is None:
+            KnownColors._console_palette = Palette(KnownColors._console_colors())
+
+        return KnownColors._console_palette
+
+    @staticmethod
+    def get_known_palette():
+        """
+        Returns the palette of all known colors.
+        :return: Palette
+        """
+
+        if KnownColors._known_palette is None:
+            KnownColors._known_palette = Palette(KnownColors._known_colors())
+
+        return KnownColors._known_palette
+
+    @staticmethod
+    def _console_colors():
+        """
+        Builds the list of the 16 console colors.
+        :return: Color[]
+        """
+
         # noinspection DuplicatedCode
         cc = list()
 
@@ -508,9 +1210,9 @@ class KnownColors:
         return cc
 
     @staticmethod
-    def get_known_colors():
+    def _known_colors():
         """
-        Returns a list of all known colors.
+        Builds the list of all known colors.
         :return: Color[]
         """
 
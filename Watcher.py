@@ -0,0 +1,312 @@
+# region License
+"""
+ * SimplRPA - A simple RPA library for Python and C#
+ *
+ * Copyright (c) 2009-2021 Michael Halpin
+ * Modifications (c) as per Git change history
+ *
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at
+ * https://mozilla.org/MPL/2.0/.
+ *
+ * The above copyright notice and this permission notice shall be included in all copies or substantial
+ * portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT
+ * LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NON-INFRINGEMENT.
+ * IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+# endregion
+import collections
+import queue
+import threading
+import time
+from Delays import *
+
+WatcherStats = collections.namedtuple("WatcherStats", "fps frames queue_depth costs")
+
+
+class WatcherConfig:
+    """
+    Instances contain the configuration settings for how a Watcher runs.
+    :prop interval: The shortest time between two captures. 0.05 caps the watcher at 20 frames per second.
+    :prop fps_window: How many of the latest frames the frame rate is measured over.
+    """
+    interval = 0.05
+    fps_window = 50
+
+
+class Watch:
+    """
+    A condition registered with a Watcher. The event is set when the condition fires, and the callback, if there is
+    one, is called with this watch on the watcher's callback thread. If evaluating the condition raises, the watch is
+    removed, the exception is kept in error and wait() raises it.
+    """
+
+    def __init__(self, condition, callback=None, once=True):
+        """
+        :param condition: The Condition object to evaluate against every frame.
+        :param callback: Optional function(watch) to call when the condition fires.
+        :param once: If true the watch is removed after it fires. Otherwise it fires again every time the condition goes
+        from not holding to holding.
+        """
+        self.condition = condition
+        self.callback = callback
+        self.once = once
+        self.event = threading.Event()
+        self.fired = 0
+        self.fired_at = None
+        self.evaluations = 0
+        self.cost = 0.0
+        self.error = None
+        self.callback_error = None
+        self.active = True
+        self._held = False
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the condition fires.
+        :param timeout: How long to wait in seconds, or None to wait forever.
+        :return: Boolean, false on a timeout.
+        """
+
+        if not self.event.wait(timeout):
+            return False
+
+        if self.error is not None:
+            raise self.error
+
+        return True
+
+    def average_cost(self):
+        """
+        Returns how long an evaluation of the condition takes on average.
+        :return: float seconds
+        """
+        return self.cost / self.evaluations if self.evaluations > 0 else 0.0
+
+    def __repr__(self):
+        return "Watch(%s)" % self.condition
+
+
+class Watcher:
+    """
+    Watches the screen on a dedicated thread. Each frame captures the union of the areas of every registered condition
+    once and evaluates all of them against it, so any number of parts of a script can observe the screen through one
+    capture stream instead of each running its own wait loop.
+    """
+
+    def __init__(self, config=None):
+        """
+        :param config: The configuration object that contains setting for how the watcher runs.
+        """
+
+        if config is None:
+            config = WatcherConfig()
+
+        self.config = config
+        self.frames = 0
+        self.error = None
+        self._watches = list()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._times = collections.deque(maxlen=max(2, config.fps_window))
+        self._callbacks = queue.Queue()
+        self._capture_thread = None
+        self._callback_thread = None
+
+    def start(self):
+        """
+        Starts the capture and callback threads.
+        :return: self
+        """
+
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return self
+
+        self._stop.clear()
+        self._capture_thread = threading.Thread(target=self._run, name="Watcher capture", daemon=True)
+        self._callback_thread = threading.Thread(target=self._dispatch, name="Watcher callbacks", daemon=True)
+        self._capture_thread.start()
+        self._callback_thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops the threads. Callbacks that are already queued still run.
+        :param timeout: How long to wait for each thread to finish.
+        :return: void
+        """
+
+        self._stop.set()
+        self._wake.set()
+        self._callbacks.put(None)
+
+        for thread in (self._capture_thread, self._callback_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+
+        self._capture_thread = None
+        self._callback_thread = None
+
+    def watch(self, condition, callback=None, once=True):
+        """
+        Registers a condition to evaluate against every frame.
+        :param condition: The Condition object, such as ColorAt, ImageIn or RegionChanged.
+        :param callback: Optional function(watch) to call when the condition fires.
+        :param once: If true the watch is removed after it fires.
+        :return: Watch
+        """
+
+        condition.reset()
+        watch = Watch(condition, callback, once)
+
+        with self._lock:
+            self._watches.append(watch)
+        self._wake.set()
+
+        return watch
+
+    def unwatch(self, watch):
+        """
+        Removes a watch from the watcher.
+        :param watch: The Watch returned by watch().
+        :return: void
+        """
+
+        watch.active = False
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def watches(self):
+        """
+        Returns the registered watches.
+        :return: Watch[]
+        """
+        with self._lock:
+            return list(self._watches)
+
+    def fps(self):
+        """
+        Returns the frame rate over the latest frames.
+        :return: float frames per second
+        """
+
+        times = list(self._times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def queue_depth(self):
+        """
+        Returns how many callbacks are waiting to be called.
+        :return: int
+        """
+        return self._callbacks.qsize()
+
+    def stats(self):
+        """
+        Returns the frame rate, the number of frames, the callback queue depth and the average evaluation cost in
+        seconds of every registered watch.
+        :return: WatcherStats
+        """
+        return WatcherStats(self.fps(), self.frames, self.queue_depth(),
+                            {watch: watch.average_cost() for watch in self.watches()})
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        """
+        The capture loop.
+        :return: void
+        """
+
+        while not self._stop.is_set():
+            watches = self.watches()
+            if len(watches) == 0:
+                # Sleep until something is registered.
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            started = time.monotonic()
+            self._frame(watches)
+
+            remaining = self.config.interval - (time.monotonic() - started)
+            if remaining > 0:
+                self._stop.wait(remaining)
+
+    def _frame(self, watches):
+        """
+        Captures one frame and evaluates every watch against it.
+        :param watches: The watches to evaluate.
+        :return: void
+        """
+
+        rcts = np.array([watch.condition.rct for watch in watches])
+        union = (int(rcts[:, 0].min()), int(rcts[:, 1].min()), int(rcts[:, 2].max()), int(rcts[:, 3].max()))
+
+        try:
+            # noinspection PyProtectedMember
+            frame = Screen._grab(union)
+        except Exception as ex:  # Keep watching; the area may be back on screen on the next frame.
+            self.error = ex
+            return
+
+        now = time.monotonic()
+        self.frames += 1
+        self._times.append(now)
+
+        for watch in watches:
+            if not watch.active:
+                continue
+
+            start = time.perf_counter()
+            try:
+                held = watch.condition.evaluate(frame, union[0], union[1], now)
+            except Exception as ex:  # A broken condition only stops its own watch, and wakes its waiters to raise.
+                watch.error = ex
+                self.unwatch(watch)
+                watch.event.set()
+                continue
+            finally:
+                watch.cost += time.perf_counter() - start
+                watch.evaluations += 1
+
+            if held and not watch._held:
+                watch.fired += 1
+                watch.fired_at = now
+                if watch.once:
+                    self.unwatch(watch)
+                watch.event.set()
+                if watch.callback is not None:
+                    self._callbacks.put(watch)
+
+            watch._held = held
+
+    def _dispatch(self):
+        """
+        The callback loop. Callbacks run here so a slow one doesn't hold up the captures.
+        :return: void
+        """
+
+        while True:
+            watch = self._callbacks.get()
+            if watch is None:
+                if self._stop.is_set():
+                    return
+                continue
+
+            try:
+                watch.callback(watch)
+            except Exception as ex:
+                watch.callback_error = ex
@@ -0,0 +1,367 @@
+# region License
+"""
+ * SimplRPA - A simple RPA library for Python and C#
+ *
+ * Copyright (c) 2009-2021 Michael Halpin
+ * Modifications (c) as per Git change history
+ *
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at
+ * https://mozilla.org/MPL/2.0/.
+ *
+ * The above copyright notice and this permission notice shall be included in all copies or substantial
+ * portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT
+ * LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NON-INFRINGEMENT.
+ * IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+# endregion
+import ctypes
+import ctypes.util
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+"""
+Screen capture through the MIT-SHM extension of the X server. The X connection and the shared memory segment are
+created once and reused for every capture, so a grab costs one XShmGetImage request instead of a new connection plus
+a full copy of the frame through the X socket.
+"""
+
+# region X11 CONSTANTS
+Z_PIXMAP = 2
+ALL_PLANES = 0xFFFFFFFFFFFFFFFF if ctypes.sizeof(ctypes.c_ulong) == 8 else 0xFFFFFFFF
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+# endregion
+
+
+# region X11 STRUCTURES
+class _XImage(ctypes.Structure):
+    """
+    The leading fields of Xlib's XImage structure. Only ever used through a pointer returned by Xlib.
+    """
+    _fields_ = [
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('xoffset', ctypes.c_int),
+        ('format', ctypes.c_int),
+        ('data', ctypes.c_void_p),
+        ('byte_order', ctypes.c_int),
+        ('bitmap_unit', ctypes.c_int),
+        ('bitmap_bit_order', ctypes.c_int),
+        ('bitmap_pad', ctypes.c_int),
+        ('depth', ctypes.c_int),
+        ('bytes_per_line', ctypes.c_int),
+        ('bits_per_pixel', ctypes.c_int),
+        ('red_mask', ctypes.c_ulong),
+        ('green_mask', ctypes.c_ulong),
+        ('blue_mask', ctypes.c_ulong),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ('shmseg', ctypes.c_ulong),
+        ('shmid', ctypes.c_int),
+        ('shmaddr', ctypes.c_void_p),
+        ('readOnly', ctypes.c_int),
+    ]
+
+
+_X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+# endregion
+
+
+def _load_libraries():
+    """
+    Loads libX11, libXext and libc and declares the signatures of the functions used by this module.
+    :return: tuple(x11, xext, libc)
+    """
+
+    names = (ctypes.util.find_library('X11'), ctypes.util.find_library('Xext'), ctypes.util.find_library('c'))
+    if None in names:
+        raise OSError('libX11, libXext and libc are required for shared memory capture.')
+
+    x11 = ctypes.CDLL(names[0])
+    xext = ctypes.CDLL(names[1])
+    libc = ctypes.CDLL(names[2], use_errno=True)
+
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XOpenDisplay.restype = ctypes.c_void_p
+    x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+    x11.XDefaultScreen.restype = ctypes.c_int
+    x11.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XRootWindow.restype = ctypes.c_ulong
+    x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XDefaultVisual.restype = ctypes.c_void_p
+    x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XDefaultDepth.restype = ctypes.c_int
+    x11.XGetGeometry.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong),
+                                 ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                 ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint),
+                                 ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint)]
+    x11.XGetGeometry.restype = ctypes.c_int
+    x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XFree.argtypes = [ctypes.c_void_p]
+    x11.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+    x11.XSetErrorHandler.restype = ctypes.c_void_p
+
+    xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+    xext.XShmQueryExtension.restype = ctypes.c_int
+    xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p,
+                                     ctypes.POINTER(_XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint]
+    xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+    xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+    xext.XShmAttach.restype = ctypes.c_int
+    xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+    xext.XShmDetach.restype = ctypes.c_int
+    xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage), ctypes.c_int,
+                                  ctypes.c_int, ctypes.c_ulong]
+    xext.XShmGetImage.restype = ctypes.c_int
+
+    libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+    libc.shmget.restype = ctypes.c_int
+    libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmdt.argtypes = [ctypes.c_void_p]
+    libc.shmdt.restype = ctypes.c_int
+    libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+    libc.shmctl.restype = ctypes.c_int
+
+    return x11, xext, libc
+
+
+class ShmCapture:
+    """
+    Keeps one X connection and one shared memory segment for the lifetime of the process and copies screen areas out
+    of it into NumPy arrays.
+    """
+
+    def __init__(self, display_name=None):
+        """
+        Opens the X connection and attaches a shared memory segment the size of the root window.
+        :param display_name: The X display to connect to. Defaults to the DISPLAY environment variable.
+        """
+
+        if display_name is None:
+            display_name = os.environ.get('DISPLAY', '')
+
+        # Shared memory only works when the X server runs on this machine.
+        if not display_name.startswith(':') and not display_name.startswith('unix:'):
+            raise OSError('Shared memory capture requires a local X display (got %r).' % display_name)
+
+        self._x11, self._xext, self._libc = _load_libraries()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._error = False
+        self._previous_handler = None
+        self._shminfo = None
+        self._image = None
+        self._capacity = 0
+
+        # Keep a reference to the callback so ctypes doesn't free it while Xlib still points at it.
+        self._error_handler = _X_ERROR_HANDLER(self._on_x_error)
+
+        self._display = self._x11.XOpenDisplay(display_name.encode())
+        if not self._display:
+            raise OSError('Unable to open X display %r.' % display_name)
+
+        if not self._xext.XShmQueryExtension(self._display):
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+            raise OSError('The X server does not support the MIT-SHM extension.')
+
+        self._screen = self._x11.XDefaultScreen(self._display)
+        self._root = self._x11.XRootWindow(self._display, self._screen)
+        self._visual = self._x11.XDefaultVisual(self._display, self._screen)
+        self._depth = self._x11.XDefaultDepth(self._display, self._screen)
+
+        if self._depth not in (24, 32):
+            self.close()
+            raise OSError('Shared memory capture only supports 24 and 32 bit visuals (got %s).' % self._depth)
+
+        width, height = self.size()
+        self._attach(width, height)
+
+    def size(self):
+        """
+        Returns the width and height of the root window, which spans every monitor. Asks the server each time, since
+        XDisplayWidth and XDisplayHeight keep the size from when the connection was opened, even after a RandR resize.
+        :return: tuple(w, h)
+        """
+
+        root = ctypes.c_ulong()
+        x, y = ctypes.c_int(), ctypes.c_int()
+        width, height, border, depth = ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint()
+        if not self._x11.XGetGeometry(self._display, self._root, ctypes.byref(root), ctypes.byref(x), ctypes.byref(y),
+                                      ctypes.byref(width), ctypes.byref(height), ctypes.byref(border),
+                                      ctypes.byref(depth)):
+            raise OSError('XGetGeometry failed.')
+
+        return width.value, height.value
+
+    def grab(self, rct):
+        """
+        Captures the area of the specified rectangle.
+        :param rct: Tuple (left, top, right, bottom) area of the screen to capture.
+        :return: RGB image array, or None if the area can't be captured through shared memory.
+        """
+
+        left, top, right, bottom = int(rct[0]), int(rct[1]), int(rct[2]), int(rct[3])
+        width = right - left
+        height = bottom - top
+
+        with self._lock:
+            if self._display is None or os.getpid() != self._pid:
+                return None  # Shared memory attachments don't survive a fork.
+
+            screen_width, screen_height = self.size()
+            if width <= 0 or height <= 0 or left < 0 or top < 0 or right > screen_width or bottom > screen_height:
+                return None  # Let the caller fall back to ImageGrab for anything off screen.
+
+            if width * height * 4 > self._capacity:
+                self._detach()
+                self._attach(screen_width, screen_height)
+
+            # The segment is sized for the whole screen, so shrink the image header to the requested area.
+            image = self._image.contents
+            image.width = width
+            image.height = height
+            image.bytes_per_line = width * image.bits_per_pixel // 8
+
+            with self._trapping_errors():
+                ok = self._xext.XShmGetImage(self._display, self._root, self._image, left, top, ALL_PLANES)
+
+            if not ok or self._error:
+                return None
+
+            buffer = (ctypes.c_ubyte * (image.bytes_per_line * height)).from_address(self._shminfo.shmaddr)
+            frame = np.frombuffer(buffer, dtype=np.uint8).reshape((height, width, 4))
+
+            # The X server hands back BGRX pixels; cvtColor also copies them out of the reusable segment.
+            return cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
+
+    def close(self):
+        """
+        Detaches the shared memory segment and closes the X connection.
+        :return: void
+        """
+
+        with self._lock:
+            if self._display is None:
+                return
+
+            if os.getpid() == self._pid:
+                self._detach()
+                self._x11.XCloseDisplay(self._display)
+
+            self._display = None
+
+    def _attach(self, width, height):
+        """
+        Creates a shared memory segment large enough for a width x height capture and attaches it to the X server.
+        :param width: The width of the largest capture.
+        :param height: The height of the largest capture.
+        :return: void
+        """
+
+        shminfo = _XShmSegmentInfo()
+        image = self._xext.XShmCreateImage(self._display, self._visual, self._depth, Z_PIXMAP, None,
+                                           ctypes.byref(shminfo), width, height)
+        if not image:
+            raise OSError('XShmCreateImage failed.')
+
+        if image.contents.bits_per_pixel != 32:
+            self._x11.XFree(image)
+            raise OSError('Shared memory capture requires 32 bits per pixel.')
+
+        size = image.contents.bytes_per_line * image.contents.height
+        shminfo.shmid = self._libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shminfo.shmid < 0:
+            self._x11.XFree(image)
+            raise OSError(ctypes.get_errno(), 'shmget failed.')
+
+        shminfo.shmaddr = self._libc.shmat(shminfo.shmid, None, 0)
+        if shminfo.shmaddr is None or shminfo.shmaddr == ctypes.c_void_p(-1).value:
+            self._libc.shmctl(shminfo.shmid, IPC_RMID, None)
+            self._x11.XFree(image)
+            raise OSError(ctypes.get_errno(), 'shmat failed.')
+
+        image.contents.data = shminfo.shmaddr
+        shminfo.readOnly = 0
+
+        with self._trapping_errors():
+            attached = self._xext.XShmAttach(self._display, ctypes.byref(shminfo))
+            self._x11.XSync(self._display, 0)
+
+        # Mark the segment for removal now; it goes away once both this process and the X server detach.
+        self._libc.shmctl(shminfo.shmid, IPC_RMID, None)
+
+        if not attached or self._error:
+            self._libc.shmdt(shminfo.shmaddr)
+            self._x11.XFree(image)
+            raise OSError('XShmAttach failed.')
+
+        self._shminfo = shminfo
+        self._image = image
+        self._capacity = size
+
+    def _detach(self):
+        """
+        Releases the current shared memory segment.
+        :return: void
+        """
+
+        if self._shminfo is None:
+            return
+
+        self._xext.XShmDetach(self._display, ctypes.byref(self._shminfo))
+        self._x11.XSync(self._display, 0)
+        self._libc.shmdt(self._shminfo.shmaddr)
+        self._x11.XFree(self._image)
+        self._shminfo = None
+        self._image = None
+        self._capacity = 0
+
+    # noinspection PyUnusedLocal
+    @contextmanager
+    def _trapping_errors(self):
+        """
+        Installs _on_x_error for the requests made inside it, and clears the error flag. The handler is process-wide,
+        so errors from other connections are passed on to the handler that was installed before.
+        :return: context manager
+        """
+
+        self._error = False
+        self._previous_handler = self._x11.XSetErrorHandler(ctypes.cast(self._error_handler, ctypes.c_void_p))
+        try:
+            yield
+        finally:
+            self._x11.XSetErrorHandler(self._previous_handler)
+            self._previous_handler = None
+
+    def _on_x_error(self, display, event):
+        """
+        Records X protocol errors on this connection instead of letting Xlib's default handler exit the process. Errors
+        on another thread's connection, such as Tk's, go to the previous handler as if this one wasn't installed.
+        :return: int
+        """
+
+        if display != self._display:
+            previous = self._previous_handler
+            if previous:
+                return _X_ERROR_HANDLER(previous)(display, event)
+            return 0
+
+        self._error = True
+        return 0
@@ -0,0 +1,144 @@
+# region License
+"""
+ * SimplRPA - A simple RPA library for Python and C#
+ *
+ * Copyright (c) 2009-2021 Michael Halpin
+ * Modifications (c) as per Git change history
+ *
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at
+ * https://mozilla.org/MPL/2.0/.
+ *
+ * The above copyright notice and this permission notice shall be included in all copies or substantial
+ * portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT
+ * LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NON-INFRINGEMENT.
+ * IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+# endregion
+import os
+import select
+import time
+
+from Xlib.display import Display
+from Xlib.ext import damage
+
+"""
+Screen change notifications through the X DAMAGE extension. The X server reports every area of the root window that
+gets drawn to, so a wait can sleep in select() until something is drawn over the watched area instead of capturing it
+over and over.
+"""
+
+
+class DamageUnavailableError(Exception):
+    """
+    Raised when the X server doesn't support the DAMAGE extension.
+    """
+
+    pass
+
+
+class DamageWatcher:
+    """
+    Listens for DAMAGE notifications on the root window over its own X connection. Damage is only reported between
+    start() and stop(), so an idle watcher doesn't queue up events for every redraw of the screen.
+    """
+
+    def __init__(self, display_name=None):
+        """
+        Opens the X connection.
+        :param display_name: The X display to connect to. Defaults to the DISPLAY environment variable.
+        """
+
+        self._display = Display(display_name or os.environ.get('DISPLAY'))
+
+        if not self._display.has_extension('DAMAGE'):
+            self._display.close()
+            raise DamageUnavailableError('The X server does not support the DAMAGE extension.')
+
+        self._display.damage_query_version()
+        self._damage = None
+        self._event_type = self._display.extension_event.DamageNotify
+
+    def start(self):
+        """
+        Starts reporting damage to the root window. Only damage from after this call is seen by wait().
+        :return: void
+        """
+
+        if self._damage is None:
+            self._damage = self._display.screen().root.damage_create(damage.DamageReportRawRectangles)
+            self._display.flush()
+
+    def stop(self):
+        """
+        Stops reporting damage and throws away the notifications that weren't read.
+        :return: void
+        """
+
+        if self._damage is None:
+            return
+
+        self._display.damage_destroy(self._damage)
+        self._damage = None
+        self._display.sync()
+        self.drain()
+
+    def drain(self):
+        """
+        Throws away the notifications received so far, so the next wait only sees new damage.
+        :return: void
+        """
+
+        while self._display.pending_events():
+            self._display.next_event()
+
+    def wait(self, rct, timeout):
+        """
+        Blocks until the specified area is drawn to, or the timeout passes.
+        :param rct: Tuple (left, top, right, bottom) area of the screen to watch.
+        :param timeout: The longest time to wait, in seconds.
+        :return: True if the area was damaged, False on timeout.
+        """
+
+        end = time.monotonic() + timeout
+        while True:
+            while self._display.pending_events():
+                event = self._display.next_event()
+                if event.type == self._event_type and DamageWatcher._intersects(event.area, rct):
+                    return True
+
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            select.select([self._display], [], [], remaining)
+
+    def close(self):
+        """
+        Stops reporting damage and closes the X connection.
+        :return: void
+        """
+
+        if self._display is None:
+            return
+
+        if self._damage is not None:
+            self._display.damage_destroy(self._damage)
+        self._display.close()
+        self._display = None
+
+    @staticmethod
+    def _intersects(area, rct):
+        """
+        Returns True if a damaged area overlaps the specified rectangle.
+        :param area: The damaged x, y, width and height reported by the server.
+        :param rct: Tuple (left, top, right, bottom) area of the screen.
+        :return: bool
+        """
+
+        return area.x < rct[2] and rct[0] < area.x + area.width and area.y < rct[3] and rct[1] < area.y + area.height
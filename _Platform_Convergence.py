@@ -32,11 +32,10 @@ import os
 import platform
 import re
 import sys
+import threading
 import time
 from contextlib import contextmanager
 
-from Screen import Screen
-from _Widget import Widget
 
 collectionsSequence = collections.abc.Sequence  # type: ignore
 version = "1.0"
@@ -85,126 +84,118 @@ def raise_simple_rpa_image_not_found_exception(wrapped_function):
     def wrapper(*args, **kwargs):
         try:
             return wrapped_function(*args, **kwargs)
-        except pyscreeze.ImageNotFoundException:
+        except _get_pyscreeze().ImageNotFoundException:
             raise ImageNotFoundException  # Raise SimpleRPA's ImageNotFoundException.
 
     return wrapper
 
 
 # region SCREEN SHOTS TODO: CAN WE JUST USE SCREEN.PY?
-try:
-    # noinspection PyUnresolvedReferences
-    import pyscreeze
-    from pyscreeze import center, grab, pixel, pixelMatchesColor, screenshot
+# PyScreeze (and the Pillow it depends on) is only imported when one of these functions is first called.
+_pyscreeze = None
 
-    # Change the locate*() functions so that they raise SimpleRPA's ImageNotFoundException instead.
-    @raise_simple_rpa_image_not_found_exception
-    def locate(*args, **kwargs):
-        return pyscreeze.locate(*args, **kwargs)
-
-
-    locate.__doc__ = pyscreeze.locate.__doc__
 
+def _get_pyscreeze():
+    """
+    Imports PyScreeze on first use.
+    :return: the pyscreeze module
+    """
 
-    @raise_simple_rpa_image_not_found_exception
-    def locate_all(*args, **kwargs):
-        return pyscreeze.locateAll(*args, **kwargs)
+    global _pyscreeze
 
+    if _pyscreeze is None:
+        try:
+            # noinspection PyUnresolvedReferences
+            import pyscreeze
+        except ImportError:
+            # If pyscreeze module is not found, screenshot-related features will simply not work.
+            raise SimpleRPAException(
+                "SimpleRPA was unable to import pyscreeze. (This is likely because you're running a version of Python "
+                "that Pillow (which pyscreeze depends on) doesn't support currently.) Please install this module to "
+                "enable the function you tried to call."
+            )
+        _pyscreeze = pyscreeze
 
-    locate_all.__doc__ = pyscreeze.locateAll.__doc__
+    return _pyscreeze
 
 
-    @raise_simple_rpa_image_not_found_exception
-    def locate_all_on_screen(*args, **kwargs):
-        return pyscreeze.locateAllOnScreen(*args, **kwargs)
+def center(*args, **kwargs):
+    return _get_pyscreeze().center(*args, **kwargs)
 
 
-    locate_all_on_screen.__doc__ = pyscreeze.locateAllOnScreen.__doc__
+def grab(*args, **kwargs):
+    return _get_pyscreeze().grab(*args, **kwargs)
 
 
-    @raise_simple_rpa_image_not_found_exception
-    def locate_center_on_screen(*args, **kwargs):
-        return pyscreeze.locateCenterOnScreen(*args, **kwargs)
+def pixel(*args, **kwargs):
+    return _get_pyscreeze().pixel(*args, **kwargs)
 
 
-    locate_center_on_screen.__doc__ = pyscreeze.locateCenterOnScreen.__doc__
+def pixelMatchesColor(*args, **kwargs):
+    return _get_pyscreeze().pixelMatchesColor(*args, **kwargs)
 
 
-    @raise_simple_rpa_image_not_found_exception
-    def locate_on_screen(*args, **kwargs):
-        return pyscreeze.locateOnScreen(*args, **kwargs)
+def screenshot(*args, **kwargs):
+    return _get_pyscreeze().screenshot(*args, **kwargs)
 
 
-    locate_on_screen.__doc__ = pyscreeze.locateOnScreen.__doc__
+# Change the locate*() functions so that they raise SimpleRPA's ImageNotFoundException instead.
+@raise_simple_rpa_image_not_found_exception
+def locate(*args, **kwargs):
+    return _get_pyscreeze().locate(*args, **kwargs)
 
 
-    @raise_simple_rpa_image_not_found_exception
-    def locate_on_window(*args, **kwargs):
-        return pyscreeze.locateOnWindow(*args, **kwargs)
+@raise_simple_rpa_image_not_found_exception
+def locate_all(*args, **kwargs):
+    return _get_pyscreeze().locateAll(*args, **kwargs)
 
 
-    locate_on_window.__doc__ = pyscreeze.locateOnWindow.__doc__
+@raise_simple_rpa_image_not_found_exception
+def locate_all_on_screen(*args, **kwargs):
+    return _get_pyscreeze().locateAllOnScreen(*args, **kwargs)
 
 
-except ImportError:
-    # If pyscreeze module is not found, screenshot-related features will simply not work.
-    # noinspection PyUnusedLocal
-    def _could_not_import_py_screeze(*unused_args, **unsed_kwargs):
-        """
-        This function raises ``SimpleRPAException``. It's used for the PyScreeze function names if the PyScreeze module
-        failed to be imported.
-        :return:
-        """
-        raise SimpleRPAException(
-            "SimpleRPA was unable to import pyscreeze. (This is likely because you're running a version of Python that "
-            "Pillow (which pyscreeze depends on) doesn't support currently.) Please install this module to enable the "
-            "function you tried to call."
-        )
+@raise_simple_rpa_image_not_found_exception
+def locate_center_on_screen(*args, **kwargs):
+    return _get_pyscreeze().locateCenterOnScreen(*args, **kwargs)
 
 
-    center = _could_not_import_py_screeze
-    grab = _could_not_import_py_screeze
-    locate = _could_not_import_py_screeze
-    locateAll = _could_not_import_py_screeze
-    locateAllOnScreen = _could_not_import_py_screeze
-    locateCenterOnScreen = _could_not_import_py_screeze
-    locateOnScreen = _could_not_import_py_screeze
-    locateOnWindow = _could_not_import_py_screeze
-    pixel = _could_not_import_py_screeze
-    pixelMatchesColor = _could_not_import_py_screeze
-    screenshot = _could_not_import_py_screeze
-# endregion
+@raise_simple_rpa_image_not_found_exception
+def locate_on_screen(*args, **kwargs):
+    return _get_pyscreeze().locateOnScreen(*args, **kwargs)
 
 
-# region IMPORTS MOUSE INFO TODO: Another thing we can get rid of eventually.
-try:
-    # noinspection PyUnresolvedReferences
-    import mouseinfo
+@raise_simple_rpa_image_not_found_exception
+def locate_on_window(*args, **kwargs):
+    return _get_pyscreeze().locateOnWindow(*args, **kwargs)
 
 
-    def mouse_info():
-        """
-        Launches the MouseInfo app. This application provides mouse coordinate information which can be useful when
-        planning GUI automation tasks. This function blocks until the application is closed.
-        :return:
-        """
-        mouseinfo.MouseInfoWindow()
+locateAll = locate_all
+locateAllOnScreen = locate_all_on_screen
+locateCenterOnScreen = locate_center_on_screen
+locateOnScreen = locate_on_screen
+locateOnWindow = locate_on_window
+# endregion
 
 
-except ImportError:
+# region IMPORTS MOUSE INFO TODO: Another thing we can get rid of eventually.
+def mouse_info():
+    """
+    Launches the MouseInfo app. This application provides mouse coordinate information which can be useful when
+    planning GUI automation tasks. This function blocks until the application is closed.
+    :return:
+    """
 
-    def mouse_info():
-        """
-        This function raises SimpleRPAException. It's used for the MouseInfo function names if the MouseInfo module
-        failed to be imported.
-        :return:
-        """
+    try:
+        # noinspection PyUnresolvedReferences
+        import mouseinfo
+    except ImportError:
         raise SimpleRPAException(
             "SimpleRPA was unable to import mouseinfo. Please install this module to enable the function you "
             "tried to call. "
         )
 
-
+    mouseinfo.MouseInfoWindow()
 # endregion
 
 
@@ -468,29 +459,143 @@ else:
     raise NotImplementedError("Your platform (%s) is not supported by SimpleRPA." % (platform.system()))
 # endregion
 
+# region PAUSE POLICY
+PauseStats = collections.namedtuple("PauseStats", "count total")
+
+
+class PausePolicy:
+    """
+    Decides how SimpleRPA pauses after its public functions. Only the outermost call pauses: the calls a function makes
+    internally, like press() inside typewrite() or mouse_down() inside mouse_move_drag(), never add their own pauses.
+    :prop mode: One of FIXED, NONE, TOP_LEVEL or ADAPTIVE.
+        FIXED pauses for the duration after every outermost call.
+        NONE never pauses.
+        TOP_LEVEL pauses once per top level action: a Mouse or Keyboard method, an action() block or a lone call.
+        ADAPTIVE is like TOP_LEVEL, but instead of a fixed pause it waits for the screen to stop changing, up to cap.
+    :prop duration: The pause in seconds. None uses the PAUSE setting.
+    :prop cap: The longest an ADAPTIVE pause may take.
+    :prop settle_time: How long the screen must stay the same for an ADAPTIVE pause to end.
+    :prop rct: The area an ADAPTIVE pause watches. None watches the whole screen.
+    :prop count: How many pauses have been made.
+    :prop total: How many seconds have been spent pausing.
+    """
+
+    FIXED = "fixed"
+    NONE = "none"
+    TOP_LEVEL = "top_level"
+    ADAPTIVE = "adaptive"
+
+    def __init__(self, mode=FIXED, duration=None, cap=1.0, settle_time=0.05, rct=None):
+        if mode not in (PausePolicy.FIXED, PausePolicy.NONE, PausePolicy.TOP_LEVEL, PausePolicy.ADAPTIVE):
+            raise SimpleRPAException("mode must be one of ('fixed', 'none', 'top_level', 'adaptive'), not %s" % mode)
+
+        self.mode = mode
+        self.duration = duration
+        self.cap = cap
+        self.settle_time = settle_time
+        self.rct = rct
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def after_call(self, in_action):
+        """
+        Called when an outermost public function returns.
+        :param in_action: True if the call is part of a larger top level action.
+        :return: void
+        """
+        if self.mode == PausePolicy.FIXED or (not in_action and self.mode != PausePolicy.NONE):
+            self.pause()
+
+    def after_action(self):
+        """
+        Called when a top level action ends.
+        :return: void
+        """
+        if self.mode in (PausePolicy.TOP_LEVEL, PausePolicy.ADAPTIVE):
+            self.pause()
+
+    def pause(self):
+        """
+        Pauses as the mode says, and adds the time to the statistics.
+        :return: void
+        """
+
+        start = time.monotonic()
+
+        if self.mode == PausePolicy.ADAPTIVE:
+            # Imported here, since Delays imports this module.
+            from Delays import Delays, DelayConfig
+
+            config = DelayConfig()
+            config.timeout = self.cap
+            rct = self.rct if self.rct is not None else (0, 0) + tuple(size())
+            # The poll behind wait_for_stable, without recording it, so the user's Delays.last_wait() is left alone.
+            # noinspection PyProtectedMember
+            Delays._poll(Delays._stable_poller(self.settle_time, config),
+                         Delays._stable_probe(rct, self.settle_time, 0.002, 4))
+        else:
+            duration = PAUSE if self.duration is None else self.duration
+            assert isinstance(duration, int) or isinstance(duration, float)
+            if duration > 0:
+                time.sleep(duration)
+
+        with self._lock:
+            self.count += 1
+            self.total += time.monotonic() - start
+
+    def stats(self):
+        """
+        Returns how many pauses have been made and how many seconds they took in total.
+        :return: PauseStats
+        """
+        with self._lock:
+            return PauseStats(self.count, self.total)
+
+    def reset(self):
+        """
+        Clears the statistics.
+        :return: void
+        """
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+# endregion
+
 # region TWEAK-ABLE SETTINGS
 # In seconds. Any duration less than this is rounded to 0.0 to instantly move the mouse.
 MINIMUM_DURATION = 0.1
 
-# If sleep_amount is less than MINIMUM_DURATION, time.sleep() will be a no-op and the mouse cursor moves there
-# instantly. TODO: This value should vary with the platform. http://stackoverflow.com/q/1133857
-MINIMUM_SLEEP = 0.05
+# How many mouse moves a second a tweened move or drag sends, at most.
+MOUSE_MOVE_RATE = 60
+
+# The Scheduler sleeps until this many seconds before an event is due, and spins for the rest, since a sleep can wake
+# up a millisecond or more late.
+SCHEDULER_SPIN = 0.002
 
 # The number of seconds to pause after EVERY public function call. Useful for debugging:
 PAUSE = 0.1  # Tenth-second pause by default.
 
+# How to pause after public function calls. See PausePolicy; PausePolicy(PausePolicy.NONE) turns the pauses off.
+PAUSE_POLICY = PausePolicy()
+
 # Interface need some catch up time on darwin (macOS) systems. Possible values probably differ based on your system
 # performance. This value affects mouse moveTo, dragTo and key event duration. TODO: Find a dynamic way to let the
 #  system catch up instead of blocking with a magic number.
 DARWIN_CATCH_UP_TIME = 0.01
 
 # If the mouse is over a coordinate in FAILSAFE_POINTS and FAILSAFE is True, the FailSafeException is raised. The
-# rest of the points are added to the FAILSAFE_POINTS list at the bottom of this file, after size() has been defined.
+# rest of the points are added to the FAILSAFE_POINTS list by _get_fail_safe_points() when they are first needed.
 # The points are for the corners of the screen, but note that these points don't automatically change if the screen
 # resolution changes.
 FAILSAFE = True
 FAILSAFE_POINTS = [(0, 0)]
 
+# If True a background thread watches the mouse for the fail-safe, so fail_safe_check() only looks at a flag instead
+# of asking the OS where the mouse is. FAILSAFE_LATENCY is how often in seconds the thread looks.
+FAILSAFE_MONITOR = True
+FAILSAFE_LATENCY = 0.05
+
 LOG_SCREENSHOTS = False  # If True, save screenshots for clicks and key presses.
 
 # If not None, SimpleRPA deletes old screenshots when this limit has been reached:
@@ -501,6 +606,13 @@ G_LOG_SCREENSHOTS_FILENAMES = []  # TODO - make this a deque
 Point = collections.namedtuple("Point", "x y")
 Size = collections.namedtuple("Size", "width height")
 
+_screen_size = None  # The cached result of size().
+_call_state = threading.local()  # How deep the calling thread is in public calls and action() blocks.
+_fail_safe_monitor = None  # The FailSafeMonitor, once started. False if it couldn't be.
+_fail_safe_lock = threading.Lock()
+_fail_safe_corners_added = False  # Whether _get_fail_safe_points() has added the screen corners to FAILSAFE_POINTS.
+_fail_safe_points_lock = threading.Lock()
+
 
 # region GENERAL METHODS
 def is_shift_character(character):
@@ -525,13 +637,40 @@ def _generic_simple_rpa_checks(wrapped_function):
     @functools.wraps(wrapped_function)
     def wrapper(*args, **kwargs):
         fail_safe_check()
-        return_val = wrapped_function(*args, **kwargs)
-        _handle_pause(kwargs.get("_pause", True))
+
+        depth = getattr(_call_state, "depth", 0)
+        _call_state.depth = depth + 1
+        try:
+            return_val = wrapped_function(*args, **kwargs)
+        finally:
+            _call_state.depth = depth
+
+        if depth == 0:  # Calls made from inside another public function never pause.
+            _handle_pause(kwargs.get("_pause", True))
         return return_val
 
     return wrapper
 
 
+@contextmanager
+def action():
+    """
+    Groups the calls inside it into one top level action, which the TOP_LEVEL and ADAPTIVE pause policies pause after
+    once. Can also be used as a decorator.
+    :return: context manager
+    """
+
+    depth = getattr(_call_state, "actions", 0)
+    _call_state.actions = depth + 1
+    try:
+        yield
+    finally:
+        _call_state.actions = depth
+
+    if depth == 0:
+        PAUSE_POLICY.after_action()
+
+
 def get_point_on_line(x1, y1, x2, y2, n):
     """
     Plots all tweening points along a line.
@@ -549,6 +688,73 @@ def get_point_on_line(x1, y1, x2, y2, n):
     return x, y
 
 
+def get_tween_path(x1, y1, x2, y2, tween, num_steps, return_index=False):
+    """
+    Plots the tweening points along a line, the same points get_point_on_line() gives for tween(n / num_steps) with n
+    from 0 to num_steps - 1, followed by the destination. The points are rounded to whole pixels and consecutive
+    duplicates are dropped, since moving to where the mouse already is would only cost another round trip.
+    :param x1: The x coordinate the line starts at.
+    :param y1: The y coordinate the line starts at.
+    :param x2: The x coordinate the line ends at.
+    :param y2: The y coordinate the line ends at.
+    :param tween: The tweening function.
+    :param num_steps: The number of steps along the line.
+    :param return_index: If true also returns the step number of every point, num_steps for the destination.
+    :return: int32 array of (x, y) rows, and the array of step numbers if return_index is true.
+    """
+
+    import numpy as np  # Imported here so that importing SimpleRPA for the keyboard doesn't load numpy.
+
+    table = _get_tween_table(tween, num_steps)
+    xs = x1 + (x2 - x1) * table
+    ys = y1 + (y2 - y1) * table
+
+    points = np.empty((num_steps + 1, 2), dtype=np.int32)
+    points[:-1, 0] = np.round(xs)
+    points[:-1, 1] = np.round(ys)
+    points[-1] = (round(x2), round(y2))  # Making sure the last position is the actual destination.
+
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+
+    if return_index:
+        return points[keep], np.flatnonzero(keep)
+    return points[keep]
+
+
+@functools.lru_cache(maxsize=64)
+def _get_tween_table(tween, num_steps):
+    """
+    Returns tween(n / num_steps) for n from 0 to num_steps - 1. The curve is evaluated on the whole array at once when
+    the tween supports it, and one sample at a time when it doesn't. Tables are cached per tween and number of steps.
+    :param tween: The tweening function.
+    :param num_steps: The number of samples.
+    :return: read-only float64 array
+    """
+
+    import numpy as np
+
+    n = np.arange(num_steps, dtype=np.float64) / num_steps
+
+    table = None
+    if tween is not linear:
+        try:
+            with np.errstate(all='ignore'):
+                table = np.asarray(tween(n), dtype=np.float64)
+            if table.shape != n.shape:
+                table = None
+        except Exception:  # Tweens that branch on or range-check their argument only take scalars.
+            table = None
+
+    if tween is linear:
+        table = n
+    elif table is None:
+        table = np.fromiter((tween(v) for v in n.tolist()), dtype=np.float64, count=num_steps)
+
+    table.setflags(write=False)
+    return table
+
+
 def linear(n):
     """
     The default tween for all mouse functions.
@@ -565,13 +771,12 @@ def linear(n):
 def _handle_pause(_pause):
     """
     A helper function for performing a pause at the end of a SimpleRPA function based on some settings.
-    :param _pause: If `_pause` is `True`, then sleep for `PAUSE` seconds (the global pause setting).
+    :param _pause: If `_pause` is `True`, then pause as PAUSE_POLICY says.
     :return: tuple
     """
 
     if _pause:
-        assert isinstance(PAUSE, int) or isinstance(PAUSE, float)
-        time.sleep(PAUSE)
+        PAUSE_POLICY.after_call(getattr(_call_state, "actions", 0) > 0)
 
 
 # noinspection PyArgumentList
@@ -600,7 +805,7 @@ def _normalize_xy_args(first_arg, second_arg):
             else:
                 return None
 
-        except pyscreeze.ImageNotFoundException:
+        except _get_pyscreeze().ImageNotFoundException:
             raise ImageNotFoundException
 
     elif isinstance(first_arg, collectionsSequence):
@@ -682,7 +887,9 @@ def _log_screenshot(log_screenshot, func_name, func_args, folder="."):
         os.unlink(os.path.join(folder, G_LOG_SCREENSHOTS_FILENAMES[0]))
         del G_LOG_SCREENSHOTS_FILENAMES[0]
 
-    pt = Widget.get_screen_resolution()
+    from Screen import Screen  # Imported here so that mouse and keyboard scripts don't load OpenCV.
+
+    pt = size()
     Screen.capture_to_file((0, 0, pt[0], pt[1]), filepath)
     G_LOG_SCREENSHOTS_FILENAMES.append(filename)
 
@@ -712,10 +919,17 @@ def position(x=None, y=None):
 # noinspection PyProtectedMember
 def size():
     """
-    Returns the width and height of the screen as a two-integer tuple.
+    Returns the width and height of the screen as a two-integer tuple. The size is cached until the platform reports
+    that the screen configuration changed.
     :return: tuple
     """
-    return Size(*platform_module._size())
+
+    global _screen_size
+
+    if platform_module._screen_changed() or _screen_size is None:
+        _screen_size = Size(*platform_module._size())
+
+    return _screen_size
 
 
 # noinspection PyProtectedMember
@@ -731,7 +945,7 @@ def on_screen(x, y=None):
     x = int(x)
     y = int(y)
 
-    width, height = platform_module._size()
+    width, height = size()
     return 0 <= x < width and 0 <= y < height
 # endregion
 
@@ -984,15 +1198,16 @@ def drag_to(
     _log_screenshot(log_screenshot, "dragTo", "%s,%s" % (x, y), folder=".")
 
     if mouse_down_up:
-        mouse_down(button=button, logScreenshot=False, _pause=False)
+        mouse_down(button=button, log_screenshot=False)
 
     mouse_move_drag("drag", x, y, x, y, duration, tween, button)
 
     if mouse_down_up:
-        mouse_up(button=button, logScreenshot=False, _pause=False)
+        mouse_up(button=button, log_screenshot=False, _pause=False)
 
 
 # noinspection PyProtectedMember
+@_generic_simple_rpa_checks
 def mouse_move_drag(move_or_drag, x1, y1, x2, y2, duration, tween=linear, button=LEFT, log_screenshot=False):
     """
     Handles the actual move or drag event, since different platforms
@@ -1017,11 +1232,11 @@ def mouse_move_drag(move_or_drag, x1, y1, x2, y2, duration, tween=linear, button
     # The move and drag code is similar, but OS X requires a special drag event instead of just a move event
     # when dragging. See https://stackoverflow.com/a/2696107/1893164
     assert move_or_drag in ("move", "drag"), "moveOrDrag must be in ('move', 'drag'), not %s" % move_or_drag
-    duration = duration / 2
+    if move_or_drag == "drag":
+        duration = duration / 2  # Half to reach the start point, half to drag from it.
 
-    move_or_drag = move_or_drag
-    if sys.platform == "darwin":
-        move_or_drag = "osx_move"  # Only OS X needs the drag event specifically.
+    if sys.platform == "darwin" and move_or_drag == "drag":
+        move_or_drag = "osx_drag"  # Only OS X needs the drag event specifically.
 
     start_x, start_y = position()
     width, height = size()
@@ -1032,53 +1247,63 @@ def mouse_move_drag(move_or_drag, x1, y1, x2, y2, duration, tween=linear, button
 
     # If the duration is small enough, just move the cursor there instantly.
     steps = [(x1, y1)]
+    offsets = [0.0]
 
     if duration > MINIMUM_DURATION:
-        # Non-instant moving/dragging involves tweening:
-        num_steps = max(width, height)
-        sleep_amount = duration / num_steps
-        if sleep_amount < MINIMUM_SLEEP:
-            num_steps = int(duration / MINIMUM_SLEEP)
-            sleep_amount = duration / num_steps
-
-        steps = [get_point_on_line(start_x, start_y, x1, y1, tween(n / num_steps)) for n in range(num_steps)]
-        # Making sure the last position is the actual destination.
-        steps.append((x2, y2))
-
-    idx = 0
-    for tween_x, tween_y in steps:
-        idx += 1
-        if len(steps) > 1:
-            # A single step does not require tweening.
-            # noinspection PyUnboundLocalVariable
-            time.sleep(sleep_amount)
-
-        tween_x = int(round(tween_x))
-        tween_y = int(round(tween_y))
+        # Non-instant moving/dragging involves tweening, at up to MOUSE_MOVE_RATE moves a second:
+        num_steps = max(1, min(max(width, height), int(duration * MOUSE_MOVE_RATE)))
+        step_time = duration / num_steps
+
+        path, index = get_tween_path(start_x, start_y, x1, y1, tween, num_steps, return_index=True)
+        steps = path.tolist()
+        index = index.tolist()
+        if (x2, y2) != (x1, y1):
+            # Making sure the last position is the actual destination.
+            if index[-1] == num_steps:
+                steps[-1] = [x2, y2]
+            else:
+                steps.append([x2, y2])
+                index.append(num_steps)
+
+        # Each point is due at the time of its step, so the points dropped as duplicates still take up their time.
+        offsets = [min(i + 1, num_steps) * step_time for i in index]
+
+    def send(i):
+        tween_x, tween_y = int(round(steps[i][0])), int(round(steps[i][1]))
 
         # Do a fail-safe check to see if the user moved the mouse to a fail-safe position, but not if the mouse cursor
         # moved there as a result of this function. (Just because tweenX and tween_y aren't in a fail-safe position
         # doesn't mean the user couldn't have moved the mouse cursor to a fail-safe position.)
-        if (tween_x, tween_y) not in FAILSAFE_POINTS:
+        if (tween_x, tween_y) not in _get_fail_safe_points():
             fail_safe_check()
 
+        _expect_position(tween_x, tween_y)
         if move_or_drag == "move":
             platform_module._move_to(tween_x, tween_y)
         elif move_or_drag == "drag":
             platform_module._move_to(tween_x, tween_y)
-            if idx == len(steps) - 1:
+            if i == len(steps) - 2:
+                _expect_position(x1, y1)
                 platform_module._move_to(x1, y1)
-                mouse_down(x1, y1, button, tween, log_screenshot, True)
-                move_to(x2, y2, duration / 2, tween, log_screenshot, True)
+                mouse_down(x1, y1, button, tween, log_screenshot)
+                move_to(x2, y2, duration, tween, log_screenshot, True)
                 mouse_up(x2, y2, button, tween, log_screenshot, True)
         elif move_or_drag == "osx_drag":
             platform_module._drag_to(tween_x, tween_y, button)
         else:
             raise NotImplementedError("Unknown value of moveOrDrag: {0}".format(move_or_drag))
 
+    # Moves may be skipped to catch up when running late, but not the last one, nor the one a drag presses the button
+    # at.
+    try:
+        Scheduler().run(offsets, send, keep_last=2 if move_or_drag == "drag" else 1)
+    finally:
+        _expect_position_done()
+    tween_x, tween_y = int(round(steps[-1][0])), int(round(steps[-1][1]))
+
     _log_screenshot(log_screenshot, "moveTo", "%s,%s-%s,%s" % (x1, y1, x2, y2), folder=".")
     # noinspection PyUnboundLocalVariable
-    if (tween_x, tween_y) not in FAILSAFE_POINTS:
+    if (tween_x, tween_y) not in _get_fail_safe_points():
         fail_safe_check()
 # endregion
 
@@ -1152,12 +1377,21 @@ def press(keys, presses=1, interval=0.0, log_screenshot=None, pause=0):
     interval = float(interval)
     _log_screenshot(log_screenshot, "press", ",".join(keys), folder=".")
 
-    for i in range(presses):
-        for k in keys:
-            fail_safe_check()
-            platform_module._key_down(k)
-            platform_module._key_up(k)
-        time.sleep(interval)
+    def send(i):
+        with platform_module._batch():
+            for k in keys:
+                fail_safe_check()
+                platform_module._key_down(k)
+                platform_module._key_up(k)
+
+    # Without an interval the whole press goes to the OS as one batch; with one, each repetition is sent on time.
+    if interval == 0:
+        with platform_module._batch():
+            for i in range(presses):
+                send(i)
+    else:
+        Scheduler().run([i * interval for i in range(presses)], send, keep_last=presses)
+        Scheduler.wait_until(time.perf_counter() + interval)
 
     if pause > 0:
         time.sleep(pause)
@@ -1181,268 +1415,503 @@ def typewrite(message, interval=0.0, log_screenshot=None, pause=0):
     interval = float(interval)  # TODO - this should be taken out.
 
     _log_screenshot(log_screenshot, "write", message, folder=".")
-    for c in message:
-        if len(c) > 1:
-            c = c.lower()
-        press(c)
-        time.sleep(interval)
+    keys = [c.lower() if len(c) > 1 else c for c in message]
+
+    def send(i):
+        press(keys[i])
         fail_safe_check()
 
+    # Without an interval the whole message goes to the OS as one batch; with one, each key is sent on time.
+    if interval == 0:
+        with platform_module._batch():
+            for i in range(len(keys)):
+                send(i)
+    else:
+        Scheduler().run([i * interval for i in range(len(keys))], send, keep_last=len(keys))
+        Scheduler.wait_until(time.perf_counter() + interval)
+
     if pause > 0:
         time.sleep(pause)
+
+
+# noinspection PyProtectedMember
+@_generic_simple_rpa_checks
+def hotkey(*keys, log_screenshot=None, _pause=True):
+    """
+    Presses a keyboard shortcut: the keys are pressed down in order and released in reverse order, sent as one batch.
+    :param keys: The key names, such as 'ctrl', 'c'. The valid names are listed in KEYBOARD_KEYS.
+    :param log_screenshot: If true a screenshot is taken during the operation.
+    :param _pause: How many seconds in the end of function process. None by default, for no pause in the end of
+    function process.
+    :return: void
+    """
+
+    _log_screenshot(log_screenshot, "hotkey", ",".join(keys), folder=".")
+    with platform_module._batch():
+        for key in keys:
+            key_down(key)
+        for key in reversed(keys):
+            key_up(key)
+# endregion
+
+
+# region SCHEDULER
+ScheduleStats = collections.namedtuple("ScheduleStats", "events skipped mean_jitter max_jitter elapsed")
+
+
+class Scheduler:
+    """
+    Runs timed input events against absolute time.perf_counter() deadlines, so the time spent sending one event doesn't
+    push back the ones after it. Each wait sleeps until shortly before the deadline and spins for the rest. When it has
+    fallen so far behind that the next event is already due, the current one is skipped.
+    :prop spin: How long before a deadline to stop sleeping and spin. None uses the SCHEDULER_SPIN setting.
+    """
+
+    _last = threading.local()
+
+    def __init__(self, spin=None):
+        self.spin = spin
+
+    def run(self, offsets, callback, keep_last=1):
+        """
+        Calls the callback for each event when it is due.
+        :param offsets: When each event is due, in seconds from the start, in ascending order.
+        :param callback: The function(i) that sends event i.
+        :param keep_last: How many of the events at the end are never skipped.
+        :return: ScheduleStats with how late the events were sent, in seconds.
+        """
+
+        spin = SCHEDULER_SPIN if self.spin is None else self.spin
+        offsets = list(offsets)
+        count = len(offsets)
+
+        sent = 0
+        skipped = 0
+        total = 0.0
+        worst = 0.0
+
+        start = time.perf_counter()
+        for i, offset in enumerate(offsets):
+            if i < count - keep_last and time.perf_counter() >= start + offsets[i + 1]:
+                skipped += 1  # Behind schedule: sending this one would only make the next one later still.
+                continue
+
+            deadline = start + offset
+            Scheduler.wait_until(deadline, spin)
+            late = time.perf_counter() - deadline
+
+            callback(i)
+
+            sent += 1
+            total += late
+            worst = max(worst, late)
+
+        stats = ScheduleStats(sent, skipped, total / sent if sent else 0.0, worst, time.perf_counter() - start)
+        Scheduler._last.stats = stats
+        return stats
+
+    @staticmethod
+    def wait_until(deadline, spin=None):
+        """
+        Waits until the time.perf_counter() deadline, sleeping most of the way and spinning the rest.
+        :param deadline: The time.perf_counter() time to wait for.
+        :param spin: How long before the deadline to stop sleeping. None uses the SCHEDULER_SPIN setting.
+        :return: void
+        """
+
+        if spin is None:
+            spin = SCHEDULER_SPIN
+
+        remaining = deadline - time.perf_counter()
+        if remaining > spin:
+            time.sleep(remaining - spin)
+        while time.perf_counter() < deadline:
+            pass
+
+    @staticmethod
+    def last_stats():
+        """
+        Returns the statistics of the calling thread's most recent scheduled run, such as the last tweened mouse move.
+        :return: ScheduleStats or None
+        """
+        return getattr(Scheduler._last, "stats", None)
+# endregion
+
+
+# region FAIL-SAFE MONITOR
+class FailSafeMonitor:
+    """
+    Watches the mouse on a background thread and raises a flag when it reaches one of the FAILSAFE_POINTS. The flag
+    is turned into a FailSafeException by the next fail_safe_check(), so the hot paths only check a boolean.
+    :prop latency: How often in seconds the mouse is looked at. None uses the FAILSAFE_LATENCY setting.
+    :prop triggered: The event that is set when the fail-safe has been triggered.
+    :prop polls: How many times the mouse has been looked at.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = latency
+        self.triggered = threading.Event()
+        self.polls = 0
+        self._expected = None
+        self._arrived = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts watching. Looks at the mouse once right away, so a fail-safe is not missed before the first poll.
+        :return: void
+        """
+
+        # noinspection PyProtectedMember
+        reader = platform_module._pointer_reader()
+        self._look(reader)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(reader,), name="Fail-safe monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops watching.
+        :return: void
+        """
+
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def expect(self, x, y):
+        """
+        Tells the monitor SimpleRPA itself is moving the mouse to a point, so a move to a fail-safe point doesn't
+        trigger it. The point is only exempt until the move is done, or the mouse is seen there and then elsewhere.
+        :param x: The x position being moved to.
+        :param y: The y position being moved to.
+        :return: void
+        """
+        self._arrived = False
+        self._expected = (x, y)
+
+    def done(self):
+        """
+        Tells the monitor the move SimpleRPA was making has finished, so its point is no longer exempt.
+        :return: void
+        """
+        self._expected = None
+
+    def check(self):
+        """
+        Raises the FailSafeException if the fail-safe has been triggered since the last check.
+        :return: void
+        """
+
+        if self.triggered.is_set():
+            self.triggered.clear()
+            _raise_fail_safe()
+
+    def _run(self, reader):
+        while not self._stop.wait(FAILSAFE_LATENCY if self.latency is None else self.latency):
+            try:
+                self._look(reader)
+            except Exception:  # Stop, and fail_safe_check() goes back to asking for the position itself.
+                return
+
+    def _look(self, reader):
+        pt = tuple(reader())
+        self.polls += 1
+
+        expected = self._expected
+        if expected is not None:
+            if pt == expected:
+                self._arrived = True
+                return
+            if self._arrived:
+                self._expected = None  # The mouse has moved on from the point, so it is no longer exempt.
+
+        if FAILSAFE and pt in _get_fail_safe_points():
+            self.triggered.set()
+
+
+def _get_fail_safe_monitor():
+    """
+    Returns the fail-safe monitor, starting it on first use.
+    :return: FailSafeMonitor or None if it isn't enabled or couldn't be started.
+    """
+
+    global _fail_safe_monitor
+
+    if not FAILSAFE_MONITOR or _fail_safe_monitor is False:
+        return None
+
+    if _fail_safe_monitor is None:
+        with _fail_safe_lock:
+            if _fail_safe_monitor is None:
+                monitor = FailSafeMonitor()
+                try:
+                    monitor.start()
+                    _fail_safe_monitor = monitor
+                except Exception:
+                    _fail_safe_monitor = False
+                    return None
+
+    return _fail_safe_monitor
+
+
+def _expect_position(x, y):
+    """
+    Tells the fail-safe monitor, if it is running, that SimpleRPA is moving the mouse to a point.
+    :param x: The x position being moved to.
+    :param y: The y position being moved to.
+    :return: void
+    """
+    if _fail_safe_monitor:
+        _fail_safe_monitor.expect(x, y)
+
+
+def _expect_position_done():
+    """
+    Tells the fail-safe monitor, if it is running, that SimpleRPA's move has finished.
+    :return: void
+    """
+    if _fail_safe_monitor:
+        _fail_safe_monitor.done()
 # endregion
 
 
 # region INTERNAL METHODS
 def fail_safe_check():
     """
-    Check to see if the mouse is in any of hte failsafe points. If so raise an exception to abort the process.
+    Check to see if the mouse is in any of hte failsafe points. If so raise an exception to abort the process. With the
+    fail-safe monitor running this only checks its flag.
     :return: void
     """
 
-    if FAILSAFE and tuple(position()) in FAILSAFE_POINTS:
-        raise FailSafeException(
-            "SimpleRPA fail-safe triggered from mouse moving to a corner of the screen. To disable this fail-safe, set "
-            "SimpleRPA.FAILSAFE to False. DISABLING FAIL-SAFE IS NOT RECOMMENDED."
-        )
+    if not FAILSAFE:
+        if _fail_safe_monitor:
+            _fail_safe_monitor.triggered.clear()  # Don't raise for something from before it was switched off.
+        return
+
+    monitor = _get_fail_safe_monitor()
+    if monitor is not None and monitor.is_running():
+        monitor.check()
+    elif tuple(position()) in _get_fail_safe_points():
+        _raise_fail_safe()
 
 
-def _get_number_token(command_str):
+def _get_fail_safe_points():
     """
-    Gets the number token at the start of command_str.
-    Given '5hello' returns '5'
-    Given '  5hello' returns '  5'
-    Given '-42hello' returns '-42'
-    Given '+42hello' returns '+42'
-    Given '3.14hello' returns '3.14'
-    Raises an exception if it can't tokenize a number.
-    :param command_str:
-    :return:
+    Returns FAILSAFE_POINTS, adding the bottom left, top right, and bottom right corners of the screen the first time.
+    (Done here rather than at import, so that importing SimpleRPA doesn't have to ask for the screen size.)
+    :return: list
     """
 
-    # noinspection RegExpSingleCharAlternation,RegExpRedundantEscape
-    pattern = re.compile(r"^(\s*(\+|\-)?\d+(\.\d+)?)")
-    mo = pattern.search(command_str)
-    if mo is None:
-        raise SimpleRPAException("Invalid command at index 0: a number was expected")
+    global _fail_safe_corners_added
+
+    if not _fail_safe_corners_added:
+        with _fail_safe_points_lock:
+            if not _fail_safe_corners_added:
+                # Only marked as added once they are, so a failing size() is tried again on the next call.
+                right, bottom = size()
+                FAILSAFE_POINTS.extend([(0, bottom - 1), (right - 1, 0), (right - 1, bottom - 1)])
+                _fail_safe_corners_added = True
+
+    return FAILSAFE_POINTS
+
+
+def _raise_fail_safe():
+    raise FailSafeException(
+        "SimpleRPA fail-safe triggered from mouse moving to a corner of the screen. To disable this fail-safe, set "
+        "SimpleRPA.FAILSAFE to False. DISABLING FAIL-SAFE IS NOT RECOMMENDED."
+    )
+
+# endregion
 
-    return mo.group(1)
 
+# region COMMAND STRINGS
+# The tokens of the command string mini-language. They are matched in place with pattern.match(command_str, i), so that
+# compiling never copies the rest of the command string.
+_COMMAND_PATTERN = re.compile(r"su|sd|ss|c|l|m|r|g|d|k|w|h|f|s|a|p")
+# noinspection RegExpRedundantEscape
+_NUMBER_PATTERN = re.compile(r"\s*([+\-]?\d+(?:\.\d+)?)")
+_QUOTED_STRING_PATTERN = re.compile(r"\s*'(.*?)'")
+_COMMA_PATTERN = re.compile(r"\s*,")
+_OPEN_PARENS_PATTERN = re.compile(r"\s*\(")
 
-def _get_quoted_string_token(command_str):
+
+def run(command_str, _ss_count=None):
     """
-    Gets the quoted string token at the start of command_str. The quoted string must use single quotes.
-    Given "'hello'world" returns "'hello'"
-    Given "  'hello'world" returns "  'hello'"
-    Raises an exception if it can't tokenize a quoted string.
-    :param command_str:
-    :return:
+    Runs a command string of the mini-language, such as "g100,200 c s0.5 f3(k'tab' k'enter')":
+    c, l, m, r click the primary, left, middle or right button. su and sd scroll up or down one click, and ss saves a
+    screenshot. gX,Y moves the mouse to X,Y, or by X,Y if both have a +/- sign, and dX,Y drags there. sN sleeps N
+    seconds and pN sets PAUSE to N. k'key' presses a key, w'text' writes text and h'ctrl,c' presses a hotkey. fN(...)
+    runs the commands in the parentheses N times. a'text' is accepted but does nothing, since there is no alert box.
+    Compiled command strings are cached, so running the same one again doesn't compile it again.
+    :param command_str: The commands to run.
+    :param _ss_count: A one item list counting the screenshots saved, which names the next one.
+    :return: void
     """
 
-    pattern = re.compile(r"^((\s*)('(.*?)'))")
-    mo = pattern.search(command_str)
+    if _ss_count is None:
+        _ss_count = [0]
+
+    _run_program(_compile_command_str(command_str), _ss_count)
+
+
+def _get_number_token(command_str, i):
+    """
+    Gets the number token at index i of command_str, after any whitespace.
+    Given ('g  -42,5', 1) returns ('-42', 5)
+    Raises an exception if it can't tokenize a number.
+    :param command_str: The command string being compiled.
+    :param i: The index to look for the number at.
+    :return: The number as a str, with any +/- sign, and the index after it.
+    """
+
+    mo = _NUMBER_PATTERN.match(command_str, i)
     if mo is None:
-        raise SimpleRPAException("Invalid command at index 0: a quoted string was expected")
+        raise SimpleRPAException("Invalid command at index %s: a number was expected" % i)
 
-    return mo.group(1)
+    return mo.group(1), mo.end()
 
 
-def _get_parens_command_str_token(command_str):
+def _get_quoted_string_token(command_str, i):
     """
-    Gets the command string token at the start of command_str. It will also be enclosed with parentheses.
-    Given "(ccc)world" returns "(ccc)"
-    Given "  (ccc)world" returns "  (ccc)"
-    Given "(ccf10(r))world" returns "(ccf10(r))"
+    Gets the quoted string token at index i of command_str, after any whitespace. The quoted string must use single
+    quotes.
+    Given ("k 'hello'world", 1) returns ('hello', 9)
     Raises an exception if it can't tokenize a quoted string.
-    :param command_str:
-    :return:
+    :param command_str: The command string being compiled.
+    :param i: The index to look for the quoted string at.
+    :return: The string without its quotes, and the index after it.
     """
 
-    # Check to make sure at least one open parenthesis exists:
-    pattern = re.compile(r"^\s*\(")
-    mo = pattern.search(command_str)
+    mo = _QUOTED_STRING_PATTERN.match(command_str, i)
     if mo is None:
-        raise SimpleRPAException("Invalid command at index 0: No open parenthesis found.")
+        raise SimpleRPAException("Invalid command at index %s: a quoted string was expected" % i)
 
-    # Check to make sure the parentheses are balanced:
-    i = 0
-    open_parens_count = 0
-    while i < len(command_str):
-        if command_str[i] == "(":
-            open_parens_count += 1
-        elif command_str[i] == ")":
-            open_parens_count -= 1
-            if open_parens_count == 0:
-                i += 1  # Remember to increment i past the ) before breaking.
-                break
-            elif open_parens_count == -1:
-                raise SimpleRPAException("Invalid command at index 0: No open parenthesis for this close parenthesis.")
-        i += 1
-    if open_parens_count > 0:
-        raise SimpleRPAException("Invalid command at index 0: Not enough close parentheses.")
+    return mo.group(1), mo.end()
 
-    return command_str[0:i]
 
-
-def _get_comma_token(command_str):
+def _get_token(pattern, command_str, i, message):
     """
-    Gets the comma token at the start of command_str.
-    Given ',' returns ','
-    Given '  ,', returns '  ,'
-    Raises an exception if a comma isn't found.
-    :param command_str:
-    :return:
+    Gets the index after the token matching pattern at index i of command_str, such as a comma or an open parenthesis.
+    Raises an exception with the message if the token isn't there.
+    :param pattern: The compiled pattern of the token.
+    :param command_str: The command string being compiled.
+    :param i: The index to look for the token at.
+    :param message: What the exception says is wrong.
+    :return: int
     """
 
-    pattern = re.compile(r"^((\s*),)")
-    mo = pattern.search(command_str)
+    mo = pattern.match(command_str, i)
     if mo is None:
-        raise SimpleRPAException("Invalid command at index 0: a comma was expected")
+        raise SimpleRPAException("Invalid command at index %s: %s" % (i, message))
 
-    return mo.group(1)
+    return mo.end()
 
 
-def _tokenize_command_str(command_str):
+@functools.lru_cache(maxsize=128)
+def _compile_command_str(command_str):
     """
-    Tokenizes command_str into a list of commands and their arguments for the run() function. Returns the list.
-    :param command_str:
-    :return:
+    Compiles command_str into a flat program for _run_program(), in one pass. Each instruction is an (opcode, operand)
+    tuple. A for loop compiles to an "f" instruction, its body, and an "endf" instruction that jumps back to the start
+    of the body, so nested loops never have to be tokenized again. Cached by the command string, whose hash is the key.
+    :param command_str: The command string to compile.
+    :return: tuple
     """
 
-    command_pattern = re.compile(r"^(su|sd|ss|c|l|m|r|g|d|k|w|h|f|s|a|p)")
+    program = []
+    loops = []  # The indexes of the "f" instructions whose close parenthesis hasn't been reached yet.
+    i = 0  # Points to the current index in command_str that is being compiled.
+    length = len(command_str)
 
-    # Tokenize the command string.
-    command_list = []
-    i = 0  # Points to the current index in command_str that is being tokenized.
-
-    while i < len(command_str):
-        if command_str[i] in (" ", "\t", "\n", "\r"):
+    while i < length:
+        char = command_str[i]
+        if char in (" ", "\t", "\n", "\r"):
             # Skip over whitespace:
             i += 1
             continue
 
-        mo = command_pattern.match(command_str[i:])
+        if char == ")":
+            # The end of a for loop's body: jump back to the start of the body, and let the "f" skip past here.
+            if not loops:
+                raise SimpleRPAException(
+                    "Invalid command at index %s: No open parenthesis for this close parenthesis." % i
+                )
+            start = loops.pop()
+            program.append(("endf", start + 1))
+            program[start] = ("f", (program[start][1], len(program)))
+            i += 1
+            continue
+
+        mo = _COMMAND_PATTERN.match(command_str, i)
         if mo is None:
-            raise SimpleRPAException("Invalid command at index %s: %s is not a valid command" % (i, command_str[i]))
+            raise SimpleRPAException("Invalid command at index %s: %s is not a valid command" % (i, char))
 
-        individual_command = mo.group(1)
-        command_list.append(individual_command)
-        i += len(individual_command)
+        command = mo.group()
+        i = mo.end()
 
         # Handle the no argument commands (c, l, m, r, su, sd, ss):
-        if individual_command in ("c", "l", "m", "r", "su", "sd", "ss"):
-            pass  # This just exists so these commands are covered by one of these cases.
+        if command in ("c", "l", "m", "r", "su", "sd", "ss"):
+            program.append((command, None))
 
         # Handle the arguments of the mouse (g)o and mouse (d)rag commands:
-        elif individual_command in ("g", "d"):
-            try:
-                x = _get_number_token(command_str[i:])
-                i += len(x)  # Increment past the x number.
-
-                comma = _get_comma_token(command_str[i:])
-                i += len(comma)  # Increment past the comma (and any whitespace).
-
-                y = _get_number_token(command_str[i:])
-                i += len(y)  # Increment past the y number.
-
-            except SimpleRPAException as excObj:
-                # Exception message starts with something like "Invalid command at index 0:"
-                # Change the index number and reraise it.
-                index_part, colon, message = str(excObj).partition(":")
-
-                index_num = index_part[len("Invalid command at index "):]
-                new_index_num = int(index_num) + i
-                raise SimpleRPAException("Invalid command at index %s:%s" % (new_index_num, message))
+        elif command in ("g", "d"):
+            x, i = _get_number_token(command_str, i)
+            i = _get_token(_COMMA_PATTERN, command_str, i, "a comma was expected")
+            y_index = i
+            y, i = _get_number_token(command_str, i)
 
             # Make sure either both x and y have +/- or neither of them do:
-            if x.lstrip()[0].isdecimal() and not y.lstrip()[0].isdecimal():
-                raise SimpleRPAException("Invalid command at index %s: Y has a +/- but X does not." % (i - len(y)))
-            if not x.lstrip()[0].isdecimal() and y.lstrip()[0].isdecimal():
-                raise SimpleRPAException(
-                    "Invalid command at index %s: Y does not have a +/- but X does." % (i - len(y))
-                )
+            if x[0].isdecimal() and not y[0].isdecimal():
+                raise SimpleRPAException("Invalid command at index %s: Y has a +/- but X does not." % y_index)
+            if not x[0].isdecimal() and y[0].isdecimal():
+                raise SimpleRPAException("Invalid command at index %s: Y does not have a +/- but X does." % y_index)
 
-            # Get rid of any whitespace at the front:
-            command_list.append(x.lstrip())
-            command_list.append(y.lstrip())
+            program.append((command, (int(float(x)), int(float(y)), not x[0].isdecimal())))
 
         # Handle the arguments of the (s)leep and (p)ause commands:
-        elif individual_command in ("s", "p"):
-            try:
-                num = _get_number_token(command_str[i:])
-                i += len(num)  # Increment past the number.
-
-                # TODO - raise an exception if a + or - is in the number.
-
-            except SimpleRPAException as excObj:
-                # Exception message starts with something like "Invalid command at index 0:"
-                # Change the index number and reraise it.
-                index_part, colon, message = str(excObj).partition(":")
-
-                index_num = index_part[len("Invalid command at index "):]
-                new_index_num = int(index_num) + i
-                raise SimpleRPAException("Invalid command at index %s:%s" % (new_index_num, message))
-
-            # Get rid of any whitespace at the front:
-            command_list.append(num.lstrip())
+        elif command in ("s", "p"):
+            num, i = _get_number_token(command_str, i)
+            program.append((command, float(num)))
 
         # Handle the arguments of the (k)ey press, (w)rite, (h)otkeys, and (a)lert commands:
-        elif individual_command in ("k", "w", "h", "a"):
-            try:
-                quoted_string = _get_quoted_string_token(command_str[i:])
-                i += len(quoted_string)  # Increment past the quoted string.
-            except SimpleRPAException as excObj:
-                # Exception message starts with something like "Invalid command at index 0:"
-                # Change the index number and reraise it.
-                index_part, colon, message = str(excObj).partition(":")
-
-                index_num = index_part[len("Invalid command at index "):]
-                new_index_num = int(index_num) + i
-                raise SimpleRPAException("Invalid command at index %s:%s" % (new_index_num, message))
-
-            # Get rid of any whitespace at the front and the quotes:
-            command_list.append(quoted_string[1:-1].lstrip())
-
-        # Handle the arguments of the (f)or loop command:
-        elif individual_command == "f":
-            try:
-                number_of_loops = _get_number_token(command_str[i:])
-                i += len(number_of_loops)  # Increment past the number of loops.
-
-                subcommand_str = _get_parens_command_str_token(command_str[i:])
-                i += len(subcommand_str)  # Increment past the sub-command string.
-
-            except SimpleRPAException as excObj:
-                # Exception message starts with something like "Invalid command at index 0:"
-                # Change the index number and reraise it.
-                index_part, colon, message = str(excObj).partition(":")
+        elif command in ("k", "w", "h", "a"):
+            text, i = _get_quoted_string_token(command_str, i)
+            if command == "h":
+                text = tuple(text.replace(" ", "").split(","))
+            program.append((command, text))
 
-                index_num = index_part[len("Invalid command at index "):]
-                new_index_num = int(index_num) + i
-                raise SimpleRPAException("Invalid command at index %s:%s" % (new_index_num, message))
-
-            # Get rid of any whitespace at the front:
-            command_list.append(number_of_loops.lstrip())
+        # Handle the arguments of the (f)or loop command, whose operand gets the end of the loop at its ")":
+        elif command == "f":
+            number_of_loops, i = _get_number_token(command_str, i)
+            i = _get_token(_OPEN_PARENS_PATTERN, command_str, i, "No open parenthesis found.")
+            loops.append(len(program))
+            program.append(("f", int(float(number_of_loops))))
 
-            # Get rid of any whitespace at the front and the quotes:
-            subcommand_str = subcommand_str.lstrip()[1:-1]
-            # Recursively call this function and append the list it returns:
-            command_list.append(_tokenize_command_str(subcommand_str))
+    if loops:
+        raise SimpleRPAException("Invalid command at index %s: Not enough close parentheses." % length)
 
-    return command_list
+    return tuple(program)
 
 
-def _run_command_list(command_list, _ss_count):
+def _run_program(program, _ss_count):
     """
-    :param command_list:
-    :param _ss_count:
-    :return:
+    Runs a program compiled by _compile_command_str().
+    :param program: The compiled instructions.
+    :param _ss_count: A one item list counting the screenshots saved, which names the next one.
+    :return: void
     """
 
     global PAUSE
+    counters = []  # The iterations left of each for loop being run, innermost last.
     i = 0
-    while i < len(command_list):
-        command = command_list[i]
+    while i < len(program):
+        command, operand = program[i]
 
         if command == "c":
             click(button=PRIMARY)
@@ -1460,43 +1929,39 @@ def _run_command_list(command_list, _ss_count):
             screenshot("screenshot%s.png" % (_ss_count[0]))
             _ss_count[0] += 1
         elif command == "s":
-            time.sleep(float(command_list[i + 1]))
-            i += 1
+            time.sleep(operand)
         elif command == "p":
-            PAUSE = float(command_list[i + 1])
-            i += 1
-        # elif command == "g":
-        #    if command_list[i + 1][0] in ("+", "-") and command_list[i + 2][0] in ("+", "-"):
-        #         move(int(command_list[i + 1]), int(command_list[i + 2]))
-        #    else:
-        #        moveTo(int(command_list[i + 1]), int(command_list[i + 2]))
-        #    i += 2
-        # elif command == "d":
-        #    if command_list[i + 1][0] in ("+", "-") and command_list[i + 2][0] in ("+", "-"):
-        #        drag(int(command_list[i + 1]), int(command_list[i + 2]))
-        #    else:
-        #        dragTo(int(command_list[i + 1]), int(command_list[i + 2]))
-        #    i += 2
+            PAUSE = operand
+        elif command in ("g", "d"):
+            x, y, relative = operand
+            if relative:
+                current_x, current_y = position()
+                x, y = current_x + x, current_y + y
+            if command == "g":
+                move_to(x, y)
+            else:
+                with action():
+                    drag_to(x, y)
         elif command == "k":
-            press(command_list[i + 1])
-            i += 1
+            press(operand)
         elif command == "w":
-            type(command_list[i + 1])
-            i += 1
-        # elif command == "h":
-        #    hotkey(*command_list[i + 1].replace(" ", "").split(","))
-        #    i += 1
-        # elif command == "a":
-        #    alert(command_list[i + 1])
-        #    i += 1
+            typewrite(operand)
+        elif command == "h":
+            with action():
+                hotkey(*operand)
+        elif command == "a":
+            pass  # There is no alert box in SimpleRPA.
         elif command == "f":
-            for j in range(int(command_list[i + 1])):
-                _run_command_list(command_list[i + 2], _ss_count)
-            i += 2
+            count, end = operand
+            if count <= 0:
+                i = end  # Skip the body.
+                continue
+            counters.append(count)
+        elif command == "endf":
+            counters[-1] -= 1
+            if counters[-1] > 0:
+                i = operand  # Jump back to the start of the body.
+                continue
+            counters.pop()
         i += 1
 # endregion
-
-
-# Add the bottom left, top right, and bottom right corners to FAILSAFE_POINTS.
-_right, _bottom = size()
-FAILSAFE_POINTS.extend([(0, _bottom - 1), (_right - 1, 0), (_right - 1, _bottom - 1)])
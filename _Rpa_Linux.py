@@ -26,16 +26,28 @@
 # NOTE - It is a known issue that the keyboard-related functions don't work on Ubuntu VMs in Virtualbox.
 
 import _Platform_Convergence
+import atexit
+import contextlib
+import hashlib
+import json
 import sys
 import os
+import threading
 import Xlib.XK
 from _Platform_Convergence import LEFT, MIDDLE, RIGHT
 from Xlib.display import Display
 from Xlib import X
+from Xlib.ext import randr
 from Xlib.ext.xtest import fake_input
 
 BUTTON_NAME_MAPPING = {LEFT: 1, MIDDLE: 2, RIGHT: 3, 1: 1, 2: 2, 3: 3, 4: 4, 5: 5, 6: 6, 7: 7}
 
+# region TWEAK-ABLE SETTINGS
+# If set, the keycodes resolved by keyboardMapping are saved to this file at exit and reused by later processes while
+# the X keymap stays the same. For example os.path.join(os.path.expanduser('~'), '.simplerpa_keymap.json').
+KEYMAP_CACHE_FILE = None
+# endregion
+
 if sys.platform in ('java', 'darwin', 'win32'):
     raise Exception('The SimpleRPA module should only be loaded on a Unix system that supports X11.')
 
@@ -54,12 +66,110 @@ def _position():
     """
 
     # noinspection PyProtectedMember
-    coord = _display.screen().root.query_pointer()._data
+    coord = _get_display().screen().root.query_pointer()._data
     return coord["root_x"], coord["root_y"]
 
 
+def _pointer_reader():
+    """
+    Returns a function that reads the mouse cursor position over its own X connection, so that another thread can
+    watch the pointer without sharing _display.
+    :return: function() returning an (x, y) tuple
+    """
+
+    display = Display(os.environ['DISPLAY'])
+    root = display.screen().root
+
+    def read():
+        # noinspection PyProtectedMember
+        coord = root.query_pointer()._data
+        return coord["root_x"], coord["root_y"]
+
+    return read
+
+
+def _get_display():
+    """
+    Returns the X connection, opening it on first use so that importing SimpleRPA doesn't connect to the X server.
+    :return: Display
+    """
+
+    global _display
+
+    display = getattr(_thread_display, "display", None)
+    if display is not None:
+        return display
+
+    if _display is None:
+        with _display_lock:
+            if _display is None:
+                # Taken from PyKeyboard's ctor function.
+                _display = Display(os.environ['DISPLAY'])
+
+    return _display
+
+
+@contextlib.contextmanager
+def _thread_connection():
+    """
+    Gives the calling thread an X connection of its own for as long as the block runs, so its input doesn't share
+    _display with other threads. If the connection can't be opened the thread keeps using _display.
+    :return: context manager
+    """
+
+    try:
+        display = Display(os.environ['DISPLAY'])
+    except Exception:  # Fall back to the shared connection.
+        display = None
+
+    _thread_display.display = display
+    try:
+        yield
+    finally:
+        _thread_display.display = None
+        if display is not None:
+            display.close()
+
+
 def _size():
-    return _display.screen().width_in_pixels, _display.screen().height_in_pixels
+    # Ask the server rather than reading width_in_pixels, which is only the size when the connection was opened.
+    geometry = _get_display().screen().root.get_geometry()
+    return geometry.width, geometry.height
+
+
+def _screen_changed():
+    """
+    Returns True if the screen size may have changed since the last call, based on RandR screen change notifications.
+    The first call opens a connection of its own to receive them on, so that reading them never takes events meant for
+    another user of _display. Without the RandR extension this always returns True.
+    :return: bool
+    """
+
+    global _randr_display
+
+    with _randr_lock:
+        if _randr_display is None:
+            display = Display(os.environ['DISPLAY'])
+            if not display.has_extension('RANDR'):
+                display.close()
+                _randr_display = False
+                return True
+            display.screen().root.xrandr_select_input(randr.RRScreenChangeNotifyMask)
+            display.flush()
+            _randr_display = display
+            return True
+
+        if _randr_display is False:
+            return True
+
+        # Only RandR notifications are selected on this connection, but check anyway.
+        changed = False
+        while _randr_display.pending_events():
+            event = _randr_display.next_event()
+            if event.type == _randr_display.extension_event.ScreenChangeNotify:
+                changed = True
+
+        return changed
 
 
 def _vscroll(clicks, x=None, y=None):
@@ -74,8 +184,9 @@ def _vscroll(clicks, x=None, y=None):
     else:
         button = 5  # scroll down
 
-    for i in range(abs(clicks)):
-        _click(x, y, button=button)
+    with _batch():
+        for i in range(abs(clicks)):
+            _click(x, y, button=button)
 
 
 def _hscroll(clicks, x=None, y=None):
@@ -90,8 +201,9 @@ def _hscroll(clicks, x=None, y=None):
     else:
         button = 6  # scroll left
 
-    for i in range(abs(clicks)):
-        _click(x, y, button=button)
+    with _batch():
+        for i in range(abs(clicks)):
+            _click(x, y, button=button)
 
 
 def _scroll(clicks, x=None, y=None):
@@ -102,29 +214,65 @@ def _click(x, y, button):
     assert button in BUTTON_NAME_MAPPING.keys(), "button argument not in ('left', 'middle', 'right', 4, 5, 6, 7)"
     button = BUTTON_NAME_MAPPING[button]
 
-    _mouse_down(x, y, button)
-    _mouse_up(x, y, button)
+    # One move for the press and release, and a single round trip for the three events.
+    with _batch():
+        _move_to(x, y)
+        fake_input(_get_display(), X.ButtonPress, button)
+        fake_input(_get_display(), X.ButtonRelease, button)
+        _sync()
 
 
 def _move_to(x, y):
-    fake_input(_display, X.MotionNotify, x=x, y=y)
-    _display.sync()
+    fake_input(_get_display(), X.MotionNotify, x=x, y=y)
+    _sync()
 
 
 def _mouse_down(x, y, button):
-    _move_to(x, y)
     assert button in BUTTON_NAME_MAPPING.keys(), "button argument not in ('left', 'middle', 'right', 4, 5, 6, 7)"
     button = BUTTON_NAME_MAPPING[button]
-    fake_input(_display, X.ButtonPress, button)
-    _display.sync()
+    with _batch():
+        _move_to(x, y)
+        fake_input(_get_display(), X.ButtonPress, button)
+        _sync()
 
 
 def _mouse_up(x, y, button):
-    _move_to(x, y)
     assert button in BUTTON_NAME_MAPPING.keys(), "button argument not in ('left', 'middle', 'right', 4, 5, 6, 7)"
     button = BUTTON_NAME_MAPPING[button]
-    fake_input(_display, X.ButtonRelease, button)
-    _display.sync()
+    with _batch():
+        _move_to(x, y)
+        fake_input(_get_display(), X.ButtonRelease, button)
+        _sync()
+
+
+@contextlib.contextmanager
+def _batch():
+    """
+    Queues the XTest requests sent inside it and waits on the X server once at the end, instead of after every event.
+    Batches nest; only the outermost one syncs.
+    :return: context manager
+    """
+
+    _batch_state.depth = getattr(_batch_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _batch_state.depth -= 1
+        if _batch_state.depth == 0 and getattr(_batch_state, "pending", False):
+            _batch_state.pending = False
+            _get_display().sync()
+
+
+def _sync():
+    """
+    Waits for the X server to process the requests sent so far, or leaves it to the end of the current batch.
+    :return: None
+    """
+
+    if getattr(_batch_state, "depth", 0) > 0:
+        _batch_state.pending = True
+    else:
+        _get_display().sync()
 
 
 def _key_down(key):
@@ -140,21 +288,21 @@ def _key_down(key):
         return
 
     if type(key) == int:
-        fake_input(_display, X.KeyPress, key)
-        _display.sync()
+        fake_input(_get_display(), X.KeyPress, key)
+        _sync()
         return
 
     needs_shift = _Platform_Convergence.is_shift_character(key)
 
     if needs_shift:
-        fake_input(_display, X.KeyPress, keyboardMapping['shift'])
+        fake_input(_get_display(), X.KeyPress, keyboardMapping['shift'])
 
-    fake_input(_display, X.KeyPress, keyboardMapping[key])
+    fake_input(_get_display(), X.KeyPress, keyboardMapping[key])
 
     if needs_shift:
-        fake_input(_display, X.KeyRelease, keyboardMapping['shift'])
+        fake_input(_get_display(), X.KeyRelease, keyboardMapping['shift'])
 
-    _display.sync()
+    _sync()
 
 
 def _key_up(key):
@@ -174,148 +322,246 @@ def _key_up(key):
     else:
         keycode = keyboardMapping[key]
 
-    fake_input(_display, X.KeyRelease, keycode)
-    _display.sync()
+    fake_input(_get_display(), X.KeyRelease, keycode)
+    _sync()
 
 
-# Taken from PyKeyboard's ctor function.
-_display = Display(os.environ['DISPLAY'])
+_display = None  # The X connection. Opened on first use by _get_display().
+_display_lock = threading.Lock()
+_thread_display = threading.local()  # A connection opened by _thread_connection(), which the thread uses over _display.
+# The connection RandR notifications arrive on. None until _screen_changed is called, False if the server has no RandR.
+_randr_display = None
+_randr_lock = threading.Lock()
+_batch_state = threading.local()  # The depth of the calling thread's open _batch() blocks, and whether one owes a sync.
 
 """ Information for keyboardMapping derived from PyKeyboard's special_key_assignment() function.
 The *KB dictionaries in SimpleRPA map a string that can be passed to keyDown(),
 keyUp(), or press() into the code used for the OS-specific keyboard function.
 They should always be lowercase, and the same keys should be used across all OSes."""
 
-keyboardMapping = dict([(key, None) for key in _Platform_Convergence.KEY_NAMES])
-keyboardMapping.update(
+# The keysym name of every key. Only the names are listed here; keyboardMapping looks up the keycodes.
+_KEYSYMS = dict(
     {
-        'backspace': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('BackSpace')),
-        '\b': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('BackSpace')),
-        'tab': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Tab')),
-        'enter': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Return')),
-        'return': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Return')),
-        'shift': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Shift_L')),
-        'ctrl': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Control_L')),
-        'alt': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Alt_L')),
-        'pause': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Pause')),
-        'capslock': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Caps_Lock')),
-        'esc': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Escape')),
-        'escape': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Escape')),
-        'pgup': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Page_Up')),
-        'pgdn': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Page_Down')),
-        'pageup': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Page_Up')),
-        'pagedown': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Page_Down')),
-        'end': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('End')),
-        'home': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Home')),
-        'left': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Left')),
-        'up': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Up')),
-        'right': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Right')),
-        'down': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Down')),
-        'select': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Select')),
-        'print': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Print')),
-        'execute': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Execute')),
-        'prtsc': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Print')),
-        'prtscr': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Print')),
-        'prntscrn': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Print')),
-        'printscreen': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Print')),
-        'insert': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Insert')),
-        'del': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Delete')),
-        'delete': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Delete')),
-        'help': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Help')),
-        'win': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Super_L')),
-        'winleft': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Super_L')),
-        'winright': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Super_R')),
-        'apps': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Menu')),
-        'num0': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_0')),
-        'num1': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_1')),
-        'num2': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_2')),
-        'num3': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_3')),
-        'num4': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_4')),
-        'num5': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_5')),
-        'num6': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_6')),
-        'num7': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_7')),
-        'num8': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_8')),
-        'num9': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_9')),
-        'multiply': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_Multiply')),
-        'add': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_Add')),
-        'separator': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_Separator')),
-        'subtract': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_Subtract')),
-        'decimal': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_Decimal')),
-        'divide': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('KP_Divide')),
-        'f1': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F1')),
-        'f2': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F2')),
-        'f3': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F3')),
-        'f4': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F4')),
-        'f5': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F5')),
-        'f6': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F6')),
-        'f7': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F7')),
-        'f8': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F8')),
-        'f9': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F9')),
-        'f10': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F10')),
-        'f11': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F11')),
-        'f12': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F12')),
-        'f13': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F13')),
-        'f14': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F14')),
-        'f15': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F15')),
-        'f16': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F16')),
-        'f17': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F17')),
-        'f18': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F18')),
-        'f19': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F19')),
-        'f20': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F20')),
-        'f21': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F21')),
-        'f22': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F22')),
-        'f23': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F23')),
-        'f24': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('F24')),
-        'numlock': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Num_Lock')),
-        'scrolllock': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Scroll_Lock')),
-        'shiftleft': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Shift_L')),
-        'shiftright': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Shift_R')),
-        'ctrlleft': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Control_L')),
-        'ctrlright': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Control_R')),
-        'altleft': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Alt_L')),
-        'altright': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Alt_R')),
+        'backspace': 'BackSpace',
+        '\b': 'BackSpace',
+        'tab': 'Tab',
+        'enter': 'Return',
+        'return': 'Return',
+        'shift': 'Shift_L',
+        'ctrl': 'Control_L',
+        'alt': 'Alt_L',
+        'pause': 'Pause',
+        'capslock': 'Caps_Lock',
+        'esc': 'Escape',
+        'escape': 'Escape',
+        'pgup': 'Page_Up',
+        'pgdn': 'Page_Down',
+        'pageup': 'Page_Up',
+        'pagedown': 'Page_Down',
+        'end': 'End',
+        'home': 'Home',
+        'left': 'Left',
+        'up': 'Up',
+        'right': 'Right',
+        'down': 'Down',
+        'select': 'Select',
+        'print': 'Print',
+        'execute': 'Execute',
+        'prtsc': 'Print',
+        'prtscr': 'Print',
+        'prntscrn': 'Print',
+        'printscreen': 'Print',
+        'insert': 'Insert',
+        'del': 'Delete',
+        'delete': 'Delete',
+        'help': 'Help',
+        'win': 'Super_L',
+        'winleft': 'Super_L',
+        'winright': 'Super_R',
+        'apps': 'Menu',
+        'num0': 'KP_0',
+        'num1': 'KP_1',
+        'num2': 'KP_2',
+        'num3': 'KP_3',
+        'num4': 'KP_4',
+        'num5': 'KP_5',
+        'num6': 'KP_6',
+        'num7': 'KP_7',
+        'num8': 'KP_8',
+        'num9': 'KP_9',
+        'multiply': 'KP_Multiply',
+        'add': 'KP_Add',
+        'separator': 'KP_Separator',
+        'subtract': 'KP_Subtract',
+        'decimal': 'KP_Decimal',
+        'divide': 'KP_Divide',
+        'f1': 'F1',
+        'f2': 'F2',
+        'f3': 'F3',
+        'f4': 'F4',
+        'f5': 'F5',
+        'f6': 'F6',
+        'f7': 'F7',
+        'f8': 'F8',
+        'f9': 'F9',
+        'f10': 'F10',
+        'f11': 'F11',
+        'f12': 'F12',
+        'f13': 'F13',
+        'f14': 'F14',
+        'f15': 'F15',
+        'f16': 'F16',
+        'f17': 'F17',
+        'f18': 'F18',
+        'f19': 'F19',
+        'f20': 'F20',
+        'f21': 'F21',
+        'f22': 'F22',
+        'f23': 'F23',
+        'f24': 'F24',
+        'numlock': 'Num_Lock',
+        'scrolllock': 'Scroll_Lock',
+        'shiftleft': 'Shift_L',
+        'shiftright': 'Shift_R',
+        'ctrlleft': 'Control_L',
+        'ctrlright': 'Control_R',
+        'altleft': 'Alt_L',
+        'altright': 'Alt_R',
         # These are added because unlike a-zA-Z0-9, the single characters do not have a
-        ' ': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('space')),
-        'space': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('space')),
-        '\t': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Tab')),
-        '\n': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Return')),
+        ' ': 'space',
+        'space': 'space',
+        '\t': 'Tab',
+        '\n': 'Return',
         # for some reason this needs to be cr, not lf
-        '\r': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Return')),
-        '\e': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('Escape')),
-        '!': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('exclam')),
-        '#': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('numbersign')),
-        '%': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('percent')),
-        '$': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('dollar')),
-        '&': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('ampersand')),
-        '"': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('quotedbl')),
-        "'": _display.keysym_to_keycode(Xlib.XK.string_to_keysym('apostrophe')),
-        '(': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('parenleft')),
-        ')': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('parenright')),
-        '*': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('asterisk')),
-        '=': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('equal')),
-        '+': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('plus')),
-        ',': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('comma')),
-        '-': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('minus')),
-        '.': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('period')),
-        '/': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('slash')),
-        ':': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('colon')),
-        ';': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('semicolon')),
-        '<': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('less')),
-        '>': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('greater')),
-        '?': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('question')),
-        '@': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('at')),
-        '[': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('bracketleft')),
-        ']': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('bracketright')),
-        '\\': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('backslash')),
-        '^': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('asciicircum')),
-        '_': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('underscore')),
-        '`': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('grave')),
-        '{': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('braceleft')),
-        '|': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('bar')),
-        '}': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('braceright')),
-        '~': _display.keysym_to_keycode(Xlib.XK.string_to_keysym('asciitilde')),
+        '\r': 'Return',
+        '\e': 'Escape',
+        '!': 'exclam',
+        '#': 'numbersign',
+        '%': 'percent',
+        '$': 'dollar',
+        '&': 'ampersand',
+        '"': 'quotedbl',
+        "'": 'apostrophe',
+        '(': 'parenleft',
+        ')': 'parenright',
+        '*': 'asterisk',
+        '=': 'equal',
+        '+': 'plus',
+        ',': 'comma',
+        '-': 'minus',
+        '.': 'period',
+        '/': 'slash',
+        ':': 'colon',
+        ';': 'semicolon',
+        '<': 'less',
+        '>': 'greater',
+        '?': 'question',
+        '@': 'at',
+        '[': 'bracketleft',
+        ']': 'bracketright',
+        '\\': 'backslash',
+        '^': 'asciicircum',
+        '_': 'underscore',
+        '`': 'grave',
+        '{': 'braceleft',
+        '|': 'bar',
+        '}': 'braceright',
+        '~': 'asciitilde',
     })
 
-# Trading memory for time populate winKB, so we don't have to call VkKeyScanA each time.
 for c in """abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890""":
-    keyboardMapping[c] = _display.keysym_to_keycode(Xlib.XK.string_to_keysym(c))
+    _KEYSYMS[c] = c
+
+
+class _KeyboardMapping(dict):
+    """
+    The keyboardMapping dictionary, resolved lazily. Every key name is in it from the start, but the keycode of a key
+    is only looked up the first time the key is used. With KEYMAP_CACHE_FILE set, the resolved keycodes are saved at
+    exit and loaded again by the next process, as long as the X keymap hasn't changed.
+    """
+
+    def __init__(self):
+        super().__init__((key, _UNRESOLVED) for key in _Platform_Convergence.KEY_NAMES)
+        self.update((key, _UNRESOLVED) for key in _KEYSYMS)
+        self._cache_loaded = False
+        self._cache_dirty = False
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if value is _UNRESOLVED:
+            value = self._resolve(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def resolve_all(self):
+        """
+        Looks up the keycode of every key now.
+        :return: void
+        """
+        for key in list(self.keys()):
+            _ = self[key]
+
+    def _resolve(self, key):
+        if not self._cache_loaded:
+            self._cache_loaded = True
+            self._load_cache()
+            value = dict.__getitem__(self, key)
+            if value is not _UNRESOLVED:
+                return value
+
+        keysym = _KEYSYMS.get(key)
+        value = None if keysym is None else _get_display().keysym_to_keycode(Xlib.XK.string_to_keysym(keysym))
+        dict.__setitem__(self, key, value)
+
+        if KEYMAP_CACHE_FILE is not None:
+            self._cache_dirty = True
+        return value
+
+    def _load_cache(self):
+        if KEYMAP_CACHE_FILE is None:
+            return
+
+        atexit.register(self._save_cache)
+        try:
+            with open(KEYMAP_CACHE_FILE, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if cache.get("keymap") != _keymap_hash():
+            return
+
+        for key, value in cache.get("keycodes", dict()).items():
+            if key in self:
+                dict.__setitem__(self, key, value)
+
+    def _save_cache(self):
+        if KEYMAP_CACHE_FILE is None or not self._cache_dirty:
+            return
+
+        keycodes = {key: value for key, value in dict.items(self) if value is not _UNRESOLVED}
+        try:
+            with open(KEYMAP_CACHE_FILE, 'w') as f:
+                json.dump({"keymap": _keymap_hash(), "keycodes": keycodes}, f)
+            self._cache_dirty = False
+        except OSError:
+            pass
+
+
+def _keymap_hash():
+    """
+    Returns a hash of the X server's current keymap, which identifies the keycodes a cached keyboardMapping holds.
+    :return: str
+    """
+
+    display = _get_display()
+    first = display.display.info.min_keycode
+    count = display.display.info.max_keycode - first + 1
+    keymap = display.get_keyboard_mapping(first, count)
+    return hashlib.sha1(repr((first, [tuple(keysyms) for keysyms in keymap])).encode()).hexdigest()
+
+
+_UNRESOLVED = object()  # The value of a keyboardMapping key whose keycode hasn't been looked up yet.
+keyboardMapping = _KeyboardMapping()
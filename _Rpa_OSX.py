@@ -25,6 +25,7 @@
 # endregion
 
 # region IMPORTS
+import contextlib
 import time
 import sys
 # noinspection PyUnresolvedReferences
@@ -352,6 +353,37 @@ def _size():
     return Quartz.CGDisplayPixelsWide(Quartz.CGMainDisplayID()), Quartz.CGDisplayPixelsHigh(Quartz.CGMainDisplayID())
 
 
+def _screen_changed():
+    """
+    Returns True if the screen size may have changed since the last call. There are no change notifications wired up
+    on this platform, and asking for the size is a cheap local call, so it is always re-read.
+    :return: bool
+    """
+    return True
+
+
+# endregion
+
+
+# region BATCHING
+@contextlib.contextmanager
+def _batch():
+    """
+    Groups the input events of one logical action. Each event here is already handed to the OS without waiting on a
+    reply, so there is nothing to batch on this platform.
+    :return: context manager
+    """
+    yield
+
+
+@contextlib.contextmanager
+def _thread_connection():
+    """
+    Gives the calling thread a connection of its own to send input over. Input goes straight to the OS here, so there
+    is no connection to open.
+    :return: context manager
+    """
+    yield
 # endregion
 
 
@@ -365,6 +397,14 @@ def _position():
     return int(loc.x), int(Quartz.CGDisplayPixelsHigh(0) - loc.y)
 
 
+def _pointer_reader():
+    """
+    Returns a function that reads the mouse cursor position and can be called from another thread.
+    :return: function() returning an (x, y) tuple
+    """
+    return _position
+
+
 def _scroll(clicks, x=None, y=None):
     """
     Send the mouse scroll event to OS X by triggering the event in Quartz.
@@ -26,6 +26,7 @@
 # region IMPORTS
 from _Platform_Convergence import LEFT, MIDDLE, RIGHT
 import _Platform_Convergence
+import contextlib
 import ctypes
 import ctypes.wintypes
 import sys
@@ -369,6 +370,37 @@ def _size():
     return size
 
 
+def _screen_changed():
+    """
+    Returns True if the screen size may have changed since the last call. There are no change notifications wired up
+    on this platform, and asking for the size is a cheap local call, so it is always re-read.
+    :return: bool
+    """
+    return True
+
+
+# endregion
+
+
+# region BATCHING
+@contextlib.contextmanager
+def _batch():
+    """
+    Groups the input events of one logical action. Each event here is already handed to the OS without waiting on a
+    reply, so there is nothing to batch on this platform.
+    :return: context manager
+    """
+    yield
+
+
+@contextlib.contextmanager
+def _thread_connection():
+    """
+    Gives the calling thread a connection of its own to send input over. Input goes straight to the OS here, so there
+    is no connection to open.
+    :return: context manager
+    """
+    yield
 # endregion
 
 
@@ -385,6 +417,14 @@ def _position():
     return mouse_cursor
 
 
+def _pointer_reader():
+    """
+    Returns a function that reads the mouse cursor position and can be called from another thread.
+    :return: function() returning an (x, y) tuple
+    """
+    return _position
+
+
 def _move_to(x, y):
     """
     Send the mouse move event to Windows by calling SetCursorPos() win32 function.
@@ -95,9 +95,14 @@ class Widget (Thread):
 
     @staticmethod
     def get_screen_resolution():
-        screen = Tk()
-        screen.withdraw()
-        return screen.winfo_screenwidth(), screen.winfo_screenheight()
+        """
+        Returns the width and height of the screen, from the cached screen size.
+        :return: tuple(w, h)
+        """
+
+        # Imported here because _Platform_Convergence imports this module.
+        import _Platform_Convergence
+        return tuple(_Platform_Convergence.size())
 
 
 def _widget(rect, duration):
@@ -1,4 +1,6 @@
 import json
+import sys
+import time
 
 import Delays
 from Keyboard import *
@@ -6,6 +8,8 @@ from Mouse import *
 from Screen import *
 from Delays import *
 from Window import *
+from Watcher import *
+from ActionQueue import *
 
 def test_mouse():
     #mc = MouseConfig()
@@ -19,6 +23,17 @@ def test_mouse():
     #Mouse.drag((70,70), (150, 70), mc) # TODO: Not working Linux
     #time.sleep(3)
     #Mouse.scroll(-5)
+    #with ActionQueue() as aq:
+    #    aq.mouse.click((70, 70))
+    #    typed = aq.keyboard.type_keys("SimpleRPA Works!")
+    #    Delays.wait_for_stable((0, 0, 800, 600))  # Runs while the click and the typing are sent.
+    #    typed.result()
+    #    print(aq.stats())
+    #with ActionQueue() as aq:
+    #    busy = aq.submit(time.sleep, 1)
+    #    aq.mouse.click((70, 70))
+    #    aq.cancel_pending()  # Cancels the click, but wait() still waits for the sleep that is running.
+    #    assert aq.wait(5) and busy.done()
     print()
 
 
@@ -37,11 +52,15 @@ def test_keyboard():
 
 def test_screen():
     #c1 = Screen.get_pixel_color((33, 112))
+    #cs = Screen.get_pixel_colors([(33, 112), (64, 112), (33, 140)])
     #c2 = Screen.get_known_color((33, 112))
     #c3 = Screen.get_console_color((33, 112))
+    #labels = Screen.get_known_colors((0, 0, 128, 128))
     #image = Screen.capture((0, 0, 128, 128))
     #Screen.capture_to_file((0,0,128,128), "test.bmp")
     #loc = Screen.find_image('/home/michaelhalpin/PycharmProjects/SimpleRPA/Folder.png')
+    #loc = Screen.find_image("Folder.png", rct=(0, 0, 300, 200))
+    #locs = Screen.find_images(["Folder.png", "File.png"])
     print()
 
 
@@ -50,11 +69,24 @@ def test_delays():
     #c = Screen.get_pixel_color((32,32))
     #z1 = Delays.wait_for_color((32,32), c)
     #z2 = Delays.wait_for_color((32,32), (0,0,0))
+    #z3 = Delays.wait_for_colors([(32,32), (64,32)], [c, (0,0,0)], match_all=False)
     #c = DelayConfig()
     #c.threshold = .95
     #f = '/home/michaelhalpin/PycharmProjects/SimpleRPA/Folder.png'
     #z1 = Delays.wait_for_image((0,0), f, c)
     #Delays.wait_for_change((0,0,100,100))
+    #Delays.wait_for_stable((0,0,800,600), settle_time=0.3, tolerance=0.005, downsample=4)
+    #with Watcher() as w:
+    #    error = w.watch(ColorAt((32,32), (255,0,0)), lambda watch: print("error banner"), once=False)
+    #    done = w.watch(ImageIn(f, (0,0,400,300)))
+    #    done.wait(10)
+    #    print(w.stats())
+    #r = Delays.wait_for_any([ImageIn(f, (0,0,400,300), name='done'), ColorAt((32,32), (255,0,0), name='error'),
+    #                          RegionStable((0,0,100,100), 0.5)])
+    #print(r.fired, r.elapsed) if r else print("timeout")
+    #async def watch():
+    #    return await asyncio.gather(Delays.wait_for_image_async((0,0), f), Delays.wait_for_change_async((0,0,100,100)))
+    #print(asyncio.run(watch()))
     print("")
 
 
@@ -75,6 +107,144 @@ def test_gui():
     #app[header][None].type_keys("SimpleRPA Works!", with_spaces=True)
     print()
 
+
+def bench_capture(seconds=5, rct=(0, 0, 1920, 1080)):
+    # Compares the shared memory capture backend against PIL.ImageGrab. Run it on Xvfb with:
+    # xvfb-run -s "-screen 0 1920x1080x24" python __main__.py
+    import Screen as ScreenModule
+    for use_shm in (False, True):
+        ScreenModule.USE_SHM_CAPTURE = use_shm
+        frames = 0
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            Screen.capture(rct)
+            frames += 1
+        print("%s: %.1f frames/sec" % ("XShm" if use_shm else "ImageGrab", frames / seconds))
+
+
+def bench_pyramid(repeats=5, max_levels=4):
+    # Times Screen._match on a synthetic 3840x2160 frame for each pyramid depth and checks that every depth finds the
+    # same matches as the exact search. Doesn't need a display.
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(0)
+    haystack = cv2.GaussianBlur(rng.integers(0, 255, (2160, 3840), dtype=np.uint8), (0, 0), 3)
+    needle = haystack[1000:1064, 2000:2096].copy()
+    haystack[300:364, 500:596] = needle
+    exact = None
+    for levels in range(max_levels + 1):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            xs, ys, _ = Screen._match(haystack, needle, 0.9, pyramid_levels=levels, pyramid_tolerance=0.3)
+        found = set(zip(xs.tolist(), ys.tolist()))
+        elapsed = (time.perf_counter() - start) / repeats
+        if exact is None:
+            exact = (found, elapsed)
+        print("levels=%s: %.1f ms, %.1fx, same results: %s"
+              % (levels, elapsed * 1000, exact[1] / elapsed, found == exact[0]))
+
+
+def bench_tiles(repeats=3, max_workers=None):
+    # Times exact matching on a synthetic 11520x2160 (three 4K monitors) frame split into tiles on 1..N threads.
+    # Doesn't need a display.
+    import cv2
+    import numpy as np
+    import os
+    rng = np.random.default_rng(0)
+    haystack = cv2.GaussianBlur(rng.integers(0, 255, (2160, 11520), dtype=np.uint8), (0, 0), 3)
+    needle = haystack[1000:1064, 9000:9096].copy()
+    baseline = None
+    for workers in range(1, (max_workers or os.cpu_count() or 1) + 1):
+        pool = Screen._get_pool(workers)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            Screen._match(haystack, needle, 0.9, pool=pool, tiles=workers)
+        elapsed = (time.perf_counter() - start) / repeats
+        if baseline is None:
+            baseline = elapsed
+        print("workers=%s: %.1f ms, %.2fx" % (workers, elapsed * 1000, baseline / elapsed))
+
+
+def bench_keymap(repeats=5):
+    # Measures the import of _Rpa_Linux, with -X importtime, next to the cost of resolving its whole keyboard mapping,
+    # which the import used to pay up front and now only pays for the keys that are used.
+    import subprocess
+    code = "import time, _Platform_Convergence, _Rpa_Linux; s = time.perf_counter(); " \
+           "_Rpa_Linux.keyboardMapping.resolve_all(); print(time.perf_counter() - s)"
+    imports = list()
+    resolves = list()
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+        resolves.append(float(result.stdout.split()[-1]))
+        for line in result.stderr.splitlines():
+            if line.rstrip().endswith(" _Rpa_Linux"):
+                imports.append(int(line.split("|")[0].split(":")[1]) / 1e6)
+    print("import _Rpa_Linux (self): %.1f ms" % (min(imports) * 1000))
+    print("resolve every key on first use: %.1f ms" % (min(resolves) * 1000))
+
+
+def bench_startup(repeats=5, budgets=None):
+    # Imports each public module in a fresh interpreter with -X importtime and compares its cumulative import time to a
+    # budget in seconds. Mouse and Keyboard shouldn't pay for OpenCV, numpy or the X connection.
+    import subprocess
+    if budgets is None:
+        budgets = {"Keyboard": 0.15, "Mouse": 0.15, "Screen": 0.8, "Delays": 0.8}
+    for module, budget in budgets.items():
+        times = list()
+        for _ in range(repeats):
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                                    capture_output=True, text=True)
+            for line in result.stderr.splitlines():
+                parts = line.split("|")
+                if len(parts) == 3 and parts[2].strip() == module:
+                    times.append(int(parts[1]) / 1e6)
+        if not times:
+            print("%s: failed to import" % module)
+            continue
+        best = min(times)
+        print("%s: %.1f ms of %.0f ms %s" % (module, best * 1000, budget * 1000, "ok" if best <= budget else "OVER"))
+
+
+def bench_move(durations=(0.25, 0.5, 1.0), pt1=(200, 200), pt2=(1000, 700)):
+    # Times tweened moves against the duration they were asked for, with the scheduler's report of how late the moves
+    # were sent. Moves used to overrun by the time spent sending each one.
+    import _Platform_Convergence
+    for duration in durations:
+        _Platform_Convergence.move_to(pt1[0], pt1[1], _pause=False)
+        start = time.perf_counter()
+        _Platform_Convergence.move_to(pt2[0], pt2[1], duration, _pause=False)
+        elapsed = time.perf_counter() - start
+        stats = _Platform_Convergence.Scheduler.last_stats()
+        print("%.2f s move: %.3f s, %s moves, %s skipped, jitter mean %.2f ms max %.2f ms" % (
+            duration, elapsed, stats.events, stats.skipped, stats.mean_jitter * 1000, stats.max_jitter * 1000))
+
+
+def bench_commands(count=10000, repeats=5):
+    # Compiles and runs a command string of count commands. The commands only set PAUSE, so this measures the compiler
+    # and the dispatch loop rather than the input events.
+    import _Platform_Convergence
+    pause = _Platform_Convergence.PAUSE
+    command_str = " ".join(["p0.1 p0.2 f2(p0.3 p0.4)"] * (count // 5))
+    compiles = list()
+    cached = list()
+    runs = list()
+    for _ in range(repeats):
+        _Platform_Convergence._compile_command_str.cache_clear()
+        start = time.perf_counter()
+        program = _Platform_Convergence._compile_command_str(command_str)
+        compiles.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _Platform_Convergence._compile_command_str(command_str)
+        cached.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _Platform_Convergence._run_program(program, [0])
+        runs.append(time.perf_counter() - start)
+    _Platform_Convergence.PAUSE = pause
+    print("%s commands, %s instructions" % (count, len(program)))
+    print("compile: %.1f ms, cached: %.3f ms, run: %.1f ms"
+          % (min(compiles) * 1000, min(cached) * 1000, min(runs) * 1000))
+
+
 # This file contains unit tests.
 
 #test_mouse()
@@ -82,3 +252,10 @@ def test_gui():
 #test_screen()
 #test_delays()
 #test_gui()
+#bench_capture()
+#bench_pyramid()
+#bench_tiles()
+#bench_keymap()
+#bench_startup()
+#bench_move()
+#bench_commands()